@@ -0,0 +1,234 @@
+"""
+Servicio HTTP asíncrono de recomendaciones (sin Streamlit).
+- Carga el motor una sola vez al arrancar y atiende conexiones concurrentes con asyncio.
+- Las consultas al motor corren en un pool de hilos acotado: una canasta lenta no frena el event loop.
+- HTTP/1.1 mínimo con keep-alive, solo librería estándar.
+
+Endpoints:
+    GET  /health
+    POST /recommend  {"basket": ["..."], "k": 5}  o  {"text": "...", "k": 5}
+                     opcional: "fusion" (max_lift | noisy_or | weighted_sum), "partial_weight" (0-1)
+    POST /match      {"basket": ["..."], "k": 5}  o  {"text": "...", "k": 5}   (las k reglas más fuertes)
+    GET  /metrics    histogramas de latencia por span en formato Prometheus (con --perf o AURORA_PERF=1)
+
+Uso:
+    python api_server.py [--host 127.0.0.1] [--port 8080] [--snapshot rules.snap] [--threads N] [--perf]
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import perf
+from engine import RecommendationEngine
+from ranking import FUSIONS
+
+MAX_BODY_BYTES = 1 << 20
+KEEPALIVE_SECONDS = 30
+DEFAULT_K = 5
+MAX_K = 50
+MAX_HEADERS = 100
+# engine calls run in this many threads (with many rules one basket can take tens of milliseconds);
+# they are mostly Python, so threads beyond the cores only contend with the event loop for the GIL
+WORKER_THREADS = min(8, os.cpu_count() or 1)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error"}
+
+
+class RecommendationServer:
+    def __init__(self, engine, threads=WORKER_THREADS):
+        self.engine = engine
+        self.requests = 0
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="engine")
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/recommend"): self.recommend,
+            ("POST", "/match"): self.match,
+            ("GET", "/metrics"): self.metrics,
+        }
+        # handlers that never touch the engine answer on the event loop, without queueing behind it
+        self.inline = {self.health, self.metrics}
+
+    def _basket(self, payload):
+        if "basket" in payload:
+            basket = payload["basket"]
+            if not isinstance(basket, list) or not all(isinstance(p, str) for p in basket):
+                raise HTTPError(400, "'basket' must be a list of product labels")
+            return basket
+        if isinstance(payload.get("text"), str):
+            return self.engine.find_products(payload["text"])
+        raise HTTPError(400, "expected 'basket' or 'text'")
+
+    @staticmethod
+    def _k(payload):
+        k = payload.get("k", DEFAULT_K)
+        # bool is an int subclass: JSON true is not k=1
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            raise HTTPError(400, "'k' must be a positive integer")
+        return min(k, MAX_K)
+
+    def health(self, payload):
+        return {"status": "ok", "rules_version": self.engine.version, "rules": len(self.engine),
+                "products": len(self.engine.products), "requests": self.requests}
+
+    def recommend(self, payload):
+        basket = self._basket(payload)
+        k = self._k(payload)
+        fusion = payload.get("fusion", "max_lift")
+        if fusion not in FUSIONS:
+            raise HTTPError(400, f"'fusion' must be one of {', '.join(FUSIONS)}")
+        partial_weight = payload.get("partial_weight", 0.0)
+        if (isinstance(partial_weight, bool) or not isinstance(partial_weight, (int, float))
+                or not 0 <= partial_weight <= 1):
+            raise HTTPError(400, "'partial_weight' must be a number in [0, 1]")
+        recommendations = self.engine.recommend(basket, k, fusion, partial_weight)
+        return {"basket": basket, "fusion": fusion, "recommendations": recommendations}
+
+    def match(self, payload):
+        basket = self._basket(payload)
+        matched = self.engine.match_rules(basket, self._k(payload))
+        return {"basket": basket, "rules": [dict(rule, match=kind) for rule, kind in matched]}
+
+    def metrics(self, payload):
+        return perf.RECORDER.prometheus()
+
+    async def dispatch(self, method, path, body):
+        route = path.split("?", 1)[0]
+        handler = self.routes.get((method, route))
+        if handler is None:
+            if any(p == route for _, p in self.routes):
+                raise HTTPError(405, f"{method} not allowed on {path}")
+            raise HTTPError(404, f"no route for {path}")
+        payload = {}
+        if body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "body is not valid JSON")
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "body must be a JSON object")
+        if handler in self.inline:
+            return self._run(handler, payload)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._run, handler, payload)
+
+    @staticmethod
+    def _run(handler, payload):
+        # engine handlers run in a worker thread; perf.request keeps the trace in that thread's context
+        started = time.perf_counter()
+        with perf.request(handler.__name__):
+            result = handler(payload)
+        if isinstance(result, dict):
+            result["took_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+                headers = {}
+                for _ in range(MAX_HEADERS + 1):
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                else:
+                    # no blank line within MAX_HEADERS lines: refuse and drop the connection
+                    await self._respond(writer, 431, {"error": "too many header fields"}, False)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                self.requests += 1
+                try:
+                    length = int(headers.get("content-length", "0"))
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, "body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, result = 200, await self.dispatch(method.upper(), path, body)
+                except HTTPError as exc:
+                    status, result = exc.status, {"error": exc.message}
+                except (ValueError, asyncio.IncompleteReadError):
+                    status, result, keep_alive = 400, {"error": "bad request"}, False
+                except Exception as exc:  # keep serving other requests
+                    status, result = 500, {"error": str(exc)}
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, result, keep_alive):
+        if isinstance(result, str):
+            body, content_type = result.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(result, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve basket recommendations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--snapshot", help="rules snapshot (default: AURORA_SNAPSHOT / AURORA_ORDERS_CSV / built-in rules)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS, help="threads running engine calls")
+    parser.add_argument("--perf", action="store_true", help="record per-span latency (GET /metrics, JSON log lines)")
+    args = parser.parse_args(argv)
+
+    if args.perf:
+        import logging
+
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        perf.enable()
+
+    environ = dict(os.environ)
+    if args.snapshot:
+        environ["AURORA_SNAPSHOT"] = args.snapshot
+    engine = RecommendationEngine.from_env(environ)
+    print(f"{len(engine)} rules (version {engine.version}) on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(RecommendationServer(engine, args.threads).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
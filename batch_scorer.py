@@ -0,0 +1,229 @@
+"""
+Scoring por lotes: top-k productos recomendados para cada canasta de un archivo o matriz.
+- Las canastas se procesan por bloques como bitsets verticales (una fila de bits por producto).
+- Prueba de antecedente vectorizada: AND de las filas del antecedente -> canastas que lo contienen.
+- Salida en streaming (CSV largo: basket_id, rank, product, score, rule_id), memoria acotada por bloque.
+
+Uso:
+    python batch_scorer.py orders.csv --snapshot rules.snap --k 5 --out recs.csv
+"""
+
+import sys
+from array import array
+
+import numpy as np
+
+# Upper bound for the per-block (consequent products x baskets) best-rule array
+SCORE_BLOCK_BYTES = 64 * 1024 * 1024
+MAX_BLOCK_BASKETS = 65536
+
+
+class ScoredBlock:
+    """Top-k for ``n`` consecutive baskets; ``items``/``rules`` are -1 where fewer than k products apply."""
+
+    def __init__(self, start, items, scores, rules):
+        self.start = start
+        self.items = items
+        self.scores = scores
+        self.rules = rules
+
+    def __len__(self):
+        return len(self.items)
+
+
+class BatchScorer:
+    """Scores many baskets at once against a RuleTable (full antecedent matches only).
+
+    Each basket gets the consequent products it does not already hold, ranked by the strongest rule
+    (lift desc, then confidence) that recommends them, as in ``RecommendationEngine.recommend``.
+    """
+
+    def __init__(self, table, k=5, min_lift=0.0, min_confidence=0.0):
+        self.table = table
+        self.k = k
+        # rules in strength order: position in this array is the ranking key
+        self.order = table.order(table.filter(min_confidence=min_confidence, min_lift=min_lift))
+        self.columns = np.unique(table.cons_items) if len(table.cons_items) else np.zeros(0, dtype=np.int32)
+        col_of = np.full(len(table.products), -1, dtype=np.int64)
+        col_of[self.columns] = np.arange(len(self.columns))
+        self._rules = [
+            (tuple(table.antecedent_items(r).tolist()), table.consequent_items(r), col_of[table.consequent_items(r)])
+            for r in self.order.tolist()
+        ]
+        # ranking key = position * width + index in the consequent (ties keep the rule's item order)
+        self._width = int(np.diff(table.cons_offsets).max(initial=1))
+        n_cols = max(1, len(self.columns))
+        block = SCORE_BLOCK_BYTES // (8 * n_cols)
+        self.block_baskets = int(min(MAX_BLOCK_BASKETS, max(64, block // 64 * 64)))
+
+    def _empty(self, n):
+        none = np.full((n, self.k), -1, dtype=np.int64)
+        return none.astype(np.int32), np.zeros((n, self.k), dtype=np.float32), none
+
+    def _score_rows(self, rows, n):
+        """Top-k for ``n`` baskets given ``rows`` (table product id -> uint64 basket bitset)."""
+        if not self._rules:
+            return self._empty(n)
+        width = self._width
+        sentinel = len(self._rules) * width
+        # best[col, basket]: ranking key of the best rule recommending that product
+        best = np.full((len(self.columns), n), sentinel, dtype=np.int64)
+        masks = {}
+        for pos, (ante, cons, cols) in enumerate(self._rules):
+            mask = masks.get(ante)
+            if mask is None:
+                mask = rows[ante[0]].copy()
+                for item in ante[1:]:
+                    mask &= rows[item]
+                masks[ante] = mask
+            if not mask.any():
+                continue
+            # baskets holding the antecedent but not yet the consequent product
+            hit = mask & ~rows[cons]
+            hit = np.unpackbits(hit.view(np.uint8), axis=1, bitorder="little")[:, :n].view(bool)
+            sub = best[cols]
+            keys = pos * width + np.arange(len(cols))
+            new = hit & (sub == sentinel)
+            sub[new] = np.broadcast_to(keys[:, None], sub.shape)[new]
+            best[cols] = sub
+
+        # keys follow strength order, so the smallest k per basket are its top-k
+        key = best.T
+        k = min(self.k, key.shape[1])
+        if k < key.shape[1]:
+            top = np.argpartition(key, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), key.shape).copy()
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(key, top, axis=1), axis=1, kind="stable"), axis=1)
+        ranks = np.take_along_axis(key, top, axis=1)
+        valid = ranks < sentinel
+        rules = np.where(valid, self.order[np.where(valid, ranks, 0) // width], -1)
+        items = np.where(valid, self.columns[top], -1).astype(np.int32)
+        scores = np.where(valid, self.table.lift[np.maximum(rules, 0)], 0).astype(np.float32)
+        if k < self.k:
+            items_, scores_, rules_ = self._empty(n)
+            items_[:, :k], scores_[:, :k], rules_[:, :k] = items, scores, rules
+            items, scores, rules = items_, scores_, rules_
+        return items, scores, rules
+
+    def _pack(self, offsets, items):
+        """Vertical bitset rows for the CSR baskets ``offsets``/``items`` (table product ids)."""
+        n = len(offsets) - 1
+        width = -(-n // 64) * 64
+        dense = np.zeros((len(self.table.products), width), dtype=bool)
+        dense[items, np.repeat(np.arange(n), np.diff(offsets))] = True
+        return np.packbits(dense, axis=1, bitorder="little").view(np.uint64)
+
+    def score_id_baskets(self, offsets, items):
+        """Yield a ScoredBlock per block of CSR baskets (product ids of ``table.products``)."""
+        offsets = np.asarray(offsets, dtype=np.int64)
+        items = np.asarray(items, dtype=np.int64)
+        n_baskets = len(offsets) - 1
+        for start in range(0, n_baskets, self.block_baskets):
+            stop = min(n_baskets, start + self.block_baskets)
+            block_offsets = offsets[start:stop + 1] - offsets[start]
+            rows = self._pack(block_offsets, items[offsets[start]:offsets[stop]])
+            yield ScoredBlock(start, *self._score_rows(rows, stop - start))
+
+    def score_matrix(self, matrix):
+        """Yield ScoredBlocks for a miner.BasketMatrix (its product ids are mapped by label)."""
+        products = self.table.products
+        if matrix.products is products:
+            source = np.arange(len(products))
+        else:
+            source = np.array([matrix.products.get(label, -1) for label in products.labels], dtype=np.int64)
+        source[source >= matrix.n_items] = -1
+        known = source >= 0
+        words = self.block_baskets // 64
+        n_words = matrix.bits.shape[1]
+        for w0 in range(0, n_words, words):
+            w1 = min(n_words, w0 + words)
+            rows = np.zeros((len(products), w1 - w0), dtype=np.uint64)
+            rows[known] = matrix.bits[source[known], w0:w1]
+            start = w0 * 64
+            n = min(matrix.n_baskets, w1 * 64) - start
+            if n > 0:
+                yield ScoredBlock(start, *self._score_rows(rows, n))
+
+    def score_baskets(self, baskets):
+        """Yield ``(ids, ScoredBlock)`` for ``(basket_id, labels)`` pairs; unknown labels are ignored."""
+        index = self.table.products.index
+        ids, offsets, items = [], array("q", [0]), array("i")
+        start = 0
+        for basket_id, labels in baskets:
+            ids.append(basket_id)
+            items.extend(index[p] for p in set(labels) if p in index)
+            offsets.append(len(items))
+            if len(ids) == self.block_baskets:
+                yield ids, self._block(start, offsets, items)
+                start += len(ids)
+                ids, offsets, items = [], array("q", [0]), array("i")
+        if ids:
+            yield ids, self._block(start, offsets, items)
+
+    def _block(self, start, offsets, items):
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        rows = self._pack(offsets, np.frombuffer(items, dtype=np.int32))
+        return ScoredBlock(start, *self._score_rows(rows, len(offsets) - 1))
+
+    def iter_records(self, blocks):
+        """Flatten ``(ids, ScoredBlock)`` pairs into ``(basket_id, rank, product, score, rule_id)``."""
+        labels, rule_ids = self.table.products.labels, self.table.ids
+        for ids, block in blocks:
+            for row, basket_id in enumerate(ids):
+                for rank, (item, score, rule) in enumerate(zip(block.items[row].tolist(), block.scores[row].tolist(),
+                                                               block.rules[row].tolist()), 1):
+                    if item < 0:
+                        break
+                    yield basket_id, rank, labels[item], round(score, 4), str(rule_ids[rule])
+
+
+def score_file(path, table, out, k=5, order_col="order_id", product_col="product", progress=None):
+    """Stream top-k recommendations for every order in ``path`` to the text file ``out`` as CSV."""
+    import csv
+
+    from ingest import IngestReport, iter_baskets, iter_lines
+
+    report = IngestReport()
+    scorer = BatchScorer(table, k)
+    writer = csv.writer(out)
+    writer.writerow(["basket_id", "rank", "product", "score", "rule_id"])
+    baskets = iter_baskets(iter_lines(path, order_col, product_col), report, progress=progress, with_ids=True)
+    written = 0
+    for record in scorer.iter_records(scorer.score_baskets(baskets)):
+        writer.writerow(record)
+        written += 1
+    report.tick()
+    return written, report
+
+
+def main(argv=None):
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Top-k recommendations for every basket of an order-line export.")
+    parser.add_argument("orders")
+    parser.add_argument("--order-col", default="order_id")
+    parser.add_argument("--product-col", default="product")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--snapshot", help="rules snapshot (default: AURORA_SNAPSHOT / AURORA_ORDERS_CSV / built-in rules)")
+    parser.add_argument("--out", help="CSV output (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from engine import RecommendationEngine
+
+    environ = dict(os.environ)
+    if args.snapshot:
+        environ["AURORA_SNAPSHOT"] = args.snapshot
+    table = RecommendationEngine.from_env(environ).table
+    progress = lambda r: print(f"  {r}", file=sys.stderr)
+    if args.out:
+        with open(args.out, "w", newline="", encoding="utf-8") as fh:
+            written, report = score_file(args.orders, table, fh, args.k, args.order_col, args.product_col, progress)
+    else:
+        written, report = score_file(args.orders, table, sys.stdout, args.k, args.order_col, args.product_col, progress)
+    print(f"{report} -> {written:,} recommendations", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Benchmark de las rutas calientes del recomendador con datos sintéticos a escala.
+- Catálogo con popularidad Zipf y canastas con el perfil de STATS (774 SKUs, ~14.6 items/canasta),
+  escalable hasta 50k SKUs y 1M de reglas.
+- Mide detección de productos, match de reglas, respuesta rule-based, recomendación, rules_df,
+  system prompt (completo y acotado) y construcción del grafo: p50/p99, throughput y memoria pico.
+- Latencia del servicio HTTP (api_server.py) con clientes keep-alive concurrentes, y la de GET /health
+  mientras tanto: un event loop bloqueado se ve ahí. --check falla si el p99 supera API_P99_TARGET_MS.
+- Tiempo de import en frío (intérprete nuevo por módulo) de las dependencias de la app.
+- Resultados en JSON para comparar entre versiones (--compare base.json).
+
+Uso:
+    python benchmark.py --scale small --scale medium [--out bench.json] [--compare base.json]
+    python benchmark.py --products 50000 --rules 1000000 --budget 5
+"""
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from engine import RecommendationEngine
+from graph_layout import ProductGraph
+from ingest import peak_rss_mb
+from products import ProductDictionary
+from rule_store import RuleStore, RuleTable, rules_fingerprint
+
+# (products, rules); "small" is the shape of the provided STATS
+SCALES = {
+    "small": (774, 10_000),
+    "medium": (10_000, 200_000),
+    "large": (50_000, 1_000_000),
+}
+AVG_BASKET_SIZE = 14.61
+ZIPF_EXPONENT = 1.05
+ANTECEDENT_SIZES = ((1, 2, 3), (0.45, 0.40, 0.15))
+CONSEQUENT_SIZES = ((1, 2, 3), (0.70, 0.22, 0.08))
+SAMPLE_INPUTS = 256
+# graph layout is per rules version, not per request; only timed while it stays interactive
+MAX_LAYOUT_NODES = 10_000
+# heavy third-party modules plus the app's own start-up imports, timed in a fresh interpreter each
+IMPORT_MODULES = ("streamlit", "pandas", "numpy", "openai", "networkx", "matplotlib.pyplot",
+                  "engine", "graph_layout", "llm", "llm_cache", "perf")
+TIME_BUDGET_SECONDS = 2.0
+MAX_REPEAT = 500
+MIN_REPEAT = 3
+# concurrent keep-alive clients posting /recommend, and the p99 the service is meant to hold
+API_CONNECTIONS = 8
+API_P99_TARGET_MS = 10.0
+HEALTH_PROBE_SECONDS = 0.005
+
+_NOUNS = ("Huevo", "Nopal", "Jitomate", "Blueberry", "Frambuesa", "Fresa", "Kombucha", "Tortillas", "Churros",
+          "Pollo", "Aguacate", "Queso", "Yogurt", "Pan", "Miel", "Café", "Leche", "Granola", "Salsa", "Frijol",
+          "Arroz", "Chile", "Limón", "Mango", "Papaya", "Espinaca", "Cebolla", "Ajo", "Tostadas", "Mole")
+_KINDS = ("de rancho", "orgánico", "de temporada", "artesanal", "integral", "natural", "picante", "de cabra",
+          "sin azúcar", "de maíz", "con chía", "ahumado", "de jengibre", "de cardamomo", "criollo", "silvestre")
+_SIZES = ("kg", "500 gr", "250 gr", "Docena", "750 ml", "1 L", "Paquete", "5 piezas")
+
+
+def synthetic_labels(n_products, seed=0):
+    rng = np.random.default_rng(seed)
+    nouns = rng.integers(0, len(_NOUNS), n_products)
+    kinds = rng.integers(0, len(_KINDS), n_products)
+    sizes = rng.integers(0, len(_SIZES), n_products)
+    # the running number keeps labels (and their short names) unique at any scale
+    return [f"{_NOUNS[a]} {_KINDS[b]} {i} - {_SIZES[c]}" for i, (a, b, c) in
+            enumerate(zip(nouns.tolist(), kinds.tolist(), sizes.tolist()))]
+
+
+def popularity(n_products):
+    weights = 1.0 / np.arange(1, n_products + 1) ** ZIPF_EXPONENT
+    return weights / weights.sum()
+
+
+def basket_sizes(n, rng, mean=AVG_BASKET_SIZE):
+    # 1 + negative binomial: right-skewed like real carts, mean ~= ``mean``
+    return 1 + rng.negative_binomial(2, 2 / (2 + mean - 1), n)
+
+
+def synthetic_baskets(n, probabilities, rng):
+    sizes = np.minimum(basket_sizes(n, rng), len(probabilities))
+    return [np.sort(rng.choice(len(probabilities), size, replace=False, p=probabilities)).astype(np.int32)
+            for size in sizes]
+
+
+def _distinct_rows(n_rows, width, probabilities, rng):
+    """``(n_rows, width)`` product ids drawn by popularity with no repeats inside a row."""
+    items = rng.choice(len(probabilities), (n_rows, width), p=probabilities)
+    for col in range(1, width):
+        while True:
+            clash = (items[:, :col] == items[:, col:col + 1]).any(axis=1)
+            if not clash.any():
+                break
+            items[clash, col] = rng.integers(0, len(probabilities), int(clash.sum()))
+    return items
+
+
+def synthetic_table(n_products, n_rules, seed=0):
+    rng = np.random.default_rng(seed)
+    products = ProductDictionary(synthetic_labels(n_products, seed))
+    probabilities = popularity(n_products)
+    a_sizes = rng.choice(ANTECEDENT_SIZES[0], n_rules, p=ANTECEDENT_SIZES[1])
+    c_sizes = rng.choice(CONSEQUENT_SIZES[0], n_rules, p=CONSEQUENT_SIZES[1])
+    width = max(ANTECEDENT_SIZES[0]) + max(CONSEQUENT_SIZES[0])
+    items = _distinct_rows(n_rules, width, probabilities, rng).astype(np.int32)
+    cols = np.arange(width)
+    ante_mask = cols[None, :] < a_sizes[:, None]
+    cons_mask = (cols[None, :] >= a_sizes[:, None]) & (cols[None, :] < (a_sizes + c_sizes)[:, None])
+
+    def csr(mask):
+        offsets = np.zeros(n_rules + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(mask.sum(axis=1))
+        return offsets, items[mask]
+
+    ante_offsets, ante_items = csr(ante_mask)
+    cons_offsets, cons_items = csr(cons_mask)
+    support = np.clip(rng.lognormal(np.log(0.015), 0.5, n_rules), 0.01, 0.5).astype(np.float32)
+    confidence = np.clip(rng.beta(2, 4, n_rules) + 0.1, 0.2, 1.0).astype(np.float32)
+    lift = (1.0 + rng.lognormal(np.log(3.0), 0.8, n_rules)).astype(np.float32)
+    digits = len(str(n_rules))
+    ids = np.array([f"R{i:0{digits}d}" for i in range(1, n_rules + 1)], dtype=str)
+    return RuleTable(ids, products, ante_offsets, ante_items, cons_offsets, cons_items, support, confidence, lift)
+
+
+def synthetic_stats(table, n_orders=6042, seed=0):
+    rng = np.random.default_rng(seed)
+    n_products = len(table.products)
+    probabilities = popularity(n_products)
+    sizes = basket_sizes(n_orders, rng)
+    top = np.argsort(-probabilities)[:5]
+    return {
+        "total_orders": n_orders,
+        "unique_products": n_products,
+        "avg_basket_size": round(float(sizes.mean()), 2),
+        "total_items_sold": int(sizes.sum()),
+        "top_products_support": [(table.products.labels[i], round(float(min(1.0, probabilities[i] * AVG_BASKET_SIZE)), 3))
+                                 for i in top.tolist()],
+    }
+
+
+def synthetic_engine(n_products, n_rules, seed=0):
+    table = synthetic_table(n_products, n_rules, seed)
+    stats = synthetic_stats(table, seed=seed)
+    version = rules_fingerprint("synthetic", n_products, n_rules, seed)
+    return RecommendationEngine(RuleStore(table), stats, version)
+
+
+def synthetic_questions(products, n, rng):
+    probabilities = popularity(len(products))
+    questions = []
+    for size in rng.choice((1, 2, 3), n, p=(0.5, 0.35, 0.15)).tolist():
+        # short names ("Huevo de rancho 12") as a user would type them
+        names = [products.labels[i].split(" - ", 1)[0].lower()
+                 for i in np.unique(rng.choice(len(products), size, p=probabilities)).tolist()]
+        questions.append(f"Si un cliente lleva {' y '.join(names)}, ¿qué más le recomiendo?")
+    return questions
+
+
+def time_call(fn, inputs, budget=TIME_BUDGET_SECONDS, max_repeat=MAX_REPEAT, min_repeat=MIN_REPEAT):
+    """Run ``fn`` over ``inputs`` (cycled) for up to ``budget`` seconds; latency stats in ms."""
+    fn(inputs[0])  # warm-up: lazy indexes, caches
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeat and (len(samples) < min_repeat or time.perf_counter() - started < budget):
+        arg = inputs[len(samples) % len(inputs)]
+        t0 = time.perf_counter_ns()
+        fn(arg)
+        samples.append(time.perf_counter_ns() - t0)
+    return latency_stats(samples)
+
+
+def latency_stats(samples):
+    """Stats in ms for durations in ns."""
+    ms = np.array(samples) / 1e6
+    return {
+        "calls": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "ops_per_sec": round(len(samples) / (ms.sum() / 1000), 1) if ms.sum() else None,
+    }
+
+
+def api_latency(engine, baskets, connections=API_CONNECTIONS, budget=TIME_BUDGET_SECONDS):
+    """POST /recommend latency over ``connections`` concurrent keep-alive clients of a local RecommendationServer,
+    and GET /health latency probed meanwhile."""
+    import asyncio
+
+    from api_server import RecommendationServer
+
+    bodies = [json.dumps({"basket": engine.products.decode(b), "k": 5}, ensure_ascii=False).encode("utf-8")
+              for b in baskets]
+    recommend = [b"POST /recommend HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(b), b) for b in bodies]
+    health = [b"GET /health HTTP/1.1\r\n\r\n"]
+
+    async def client(port, requests, samples, deadline, pause=0.0):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            i = 0
+            while len(samples) < MAX_REPEAT * connections and (i < MIN_REPEAT or time.perf_counter() < deadline):
+                t0 = time.perf_counter_ns()
+                writer.write(requests[i % len(requests)])
+                await writer.drain()
+                head = await reader.readuntil(b"\r\n\r\n")
+                await reader.readexactly(int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0]))
+                samples.append(time.perf_counter_ns() - t0)
+                i += 1
+                if pause:
+                    await asyncio.sleep(pause)
+        finally:
+            writer.close()
+
+    async def run():
+        server = RecommendationServer(engine)
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        posted, probed = [], []
+        deadline = time.perf_counter() + budget
+        try:
+            async with listener:
+                await asyncio.gather(
+                    *(client(port, recommend[i::connections] or recommend, posted, deadline) for i in range(connections)),
+                    client(port, health, probed, deadline, HEALTH_PROBE_SECONDS),
+                )
+        finally:
+            server.executor.shutdown()
+        return posted, probed
+
+    engine.recommend(engine.products.decode(baskets[0]))  # warm-up: lazy indexes
+    posted, probed = asyncio.run(run())
+    return {"api_recommend": latency_stats(posted), "api_health_under_load": latency_stats(probed)}
+
+
+def peak_allocation_mb(fn, arg):
+    """Peak Python + NumPy allocation of one call (measured separately: tracing slows the timed runs)."""
+    tracemalloc.start()
+    try:
+        fn(arg)
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def run_scale(n_products, n_rules, seed=0, budget=TIME_BUDGET_SECONDS, name=None, progress=None):
+    rng = np.random.default_rng(seed + 1)
+    t0 = time.perf_counter()
+    engine = synthetic_engine(n_products, n_rules, seed)
+    build_seconds = time.perf_counter() - t0
+    products = engine.products
+    questions = synthetic_questions(products, SAMPLE_INPUTS, rng)
+    found = [engine.find_products(q) for q in questions]
+    baskets = synthetic_baskets(SAMPLE_INPUTS, popularity(len(products)), rng)
+
+    ops = {
+        "find_products_in_text": (engine.find_products, questions),
+        "match_rules_by_products": (engine.match_rules, found),
+        "rule_based_answer": (engine.rule_based_answer, questions),
+        "recommend_basket": (lambda items: engine.recommend_ids(items, 5, "max_lift", 0.5), baskets),
+        "build_scoped_prompt": (engine.build_scoped_prompt, questions),
+        "rules_df": (lambda _: engine.rules_df(), [None]),
+        "build_system_prompt": (lambda _: engine.build_system_prompt(), [None]),
+        "graph_build": (lambda _: ProductGraph.from_table(engine.table), [None]),
+    }
+    graph = ProductGraph.from_table(engine.table)
+    if len(graph) <= MAX_LAYOUT_NODES:
+        ops["graph_layout"] = (lambda _: ProductGraph(graph.nodes, graph.src, graph.dst, graph.lift,
+                                                      graph.confidence, graph.rules).layout(), [None])
+
+    results = {}
+    for op, (fn, inputs) in ops.items():
+        results[op] = time_call(fn, inputs, budget)
+        results[op]["peak_alloc_mb"] = peak_allocation_mb(fn, inputs[0])
+        if progress:
+            progress(op, results[op])
+    for op, stats in api_latency(engine, baskets, budget=budget).items():
+        results[op] = dict(stats, peak_alloc_mb=None)
+        if progress:
+            progress(op, results[op])
+    return {
+        "scale": name or f"{n_products}x{n_rules}",
+        "products": n_products,
+        "rules": n_rules,
+        "seed": seed,
+        "build_seconds": round(build_seconds, 3),
+        "table_mb": round(engine.table.nbytes / 2**20, 2),
+        "graph_nodes": len(graph),
+        "graph_edges": len(graph.src),
+        "peak_rss_mb": None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+        "ops": results,
+    }
+
+
+def import_times(modules=IMPORT_MODULES, repeat=3):
+    """Best-of-``repeat`` cold import time in ms per module (``None`` if it is not installed)."""
+    import importlib.util
+    import os
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    times = {}
+    for module in modules:
+        try:
+            if importlib.util.find_spec(module.split(".")[0]) is None:
+                times[module] = None
+                continue
+        except ValueError:
+            times[module] = None
+            continue
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        best = None
+        for _ in range(repeat):
+            done = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=here)
+            if done.returncode != 0:
+                break
+            seconds = float(done.stdout.strip().splitlines()[-1])
+            best = seconds if best is None else min(best, seconds)
+        times[module] = None if best is None else round(best * 1000, 1)
+    return times
+
+
+def environment():
+    import subprocess
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline):
+    """Lines with the p50 ratio (new / baseline) for every op present in both runs."""
+    base = {(r["scale"], op): stats for r in baseline["results"] for op, stats in r["ops"].items()}
+    lines = []
+    for module, ms in results.get("imports_ms", {}).items():
+        old = baseline.get("imports_ms", {}).get(module)
+        if ms is not None and old:
+            lines.append(f"{'import':>8} {module:<24} {old:>10.1f} -> {ms:>10.1f} ms (x{ms / old:.2f})")
+    for r in results["results"]:
+        for op, stats in r["ops"].items():
+            old = base.get((r["scale"], op))
+            if old and old["p50_ms"]:
+                lines.append(f"{r['scale']:>8} {op:<24} {old['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms "
+                             f"(x{stats['p50_ms'] / old['p50_ms']:.2f})")
+    return lines
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation hot paths on synthetic data.")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES),
+                        help="preset size (repeatable; default: small)")
+    parser.add_argument("--products", type=int, help="custom catalog size (with --rules)")
+    parser.add_argument("--rules", type=int, help="custom rule count (with --products)")
+    parser.add_argument("--budget", type=float, default=TIME_BUDGET_SECONDS, help="seconds per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--compare", help="previous benchmark JSON to compare p50 against")
+    parser.add_argument("--skip-imports", action="store_true", help="do not time cold imports")
+    parser.add_argument("--check", action="store_true",
+                        help=f"exit 1 if an API p99 is over {API_P99_TARGET_MS:g} ms")
+    args = parser.parse_args(argv)
+
+    runs = [(name, *SCALES[name]) for name in (args.scale or [])]
+    if args.products or args.rules:
+        if not (args.products and args.rules):
+            parser.error("--products and --rules go together")
+        runs.append((None, args.products, args.rules))
+    runs = runs or [("small", *SCALES["small"])]
+
+    results = {"environment": environment(), "imports_ms": {}, "results": []}
+    if not args.skip_imports:
+        results["imports_ms"] = import_times()
+        for module, ms in results["imports_ms"].items():
+            print(f"  import {module:<20} {'not installed' if ms is None else f'{ms:,.1f} ms'}", file=sys.stderr)
+    for name, n_products, n_rules in runs:
+        print(f"== {name or 'custom'}: {n_products:,} products, {n_rules:,} rules", file=sys.stderr)
+        progress = lambda op, s: print(f"  {op:<24} p50 {s['p50_ms']:>10.3f} ms  p99 {s['p99_ms']:>10.3f} ms  "
+                                       f"{s['ops_per_sec'] or 0:>10,.1f} ops/s  {s['peak_alloc_mb'] or 0:>8.2f} MB",
+                                       file=sys.stderr)
+        results["results"].append(run_scale(n_products, n_rules, args.seed, args.budget, name, progress))
+
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, ensure_ascii=False, indent=2)
+    print(f"results -> {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            for line in compare(results, json.load(fh)):
+                print(line)
+    if args.check:
+        over = [f"{r['scale']} {op} p99 {stats['p99_ms']:.1f} ms" for r in results["results"]
+                for op, stats in r["ops"].items() if op.startswith("api_") and stats["p99_ms"] > API_P99_TARGET_MS]
+        if over:
+            sys.exit(f"over the {API_P99_TARGET_MS:g} ms p99 target: {'; '.join(over)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,304 +3,163 @@
 Streamlit app: Recomendador / Chatbot basado en reglas de asociación.
 - Modo local (rule-based) para respuestas rápidas y reproducibles.
 - Modo LLM (usa la API de OpenAI con la API key que el usuario pega).
+- Modo híbrido: respuesta local inmediata mientras el LLM responde en un hilo; contrasta las citas de ambos.
 """
 
 import streamlit as st
 import pandas as pd
 
-# Try to import optional dependencies with fallbacks
-try:
-    import networkx as nx
-    import matplotlib.pyplot as plt
-    HAS_GRAPH_LIBS = True
-except ImportError:
-    HAS_GRAPH_LIBS = False
-    st.warning("NetworkX and/or Matplotlib not available. Graph visualization will be disabled.")
-
-try:
-    import openai
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
+import streamlit.components.v1 as components
+
+import importlib.util
+
+# Optional dependencies are only located here; openai is imported on first use of LLM mode
+# (llm.make_openai_client), so page start-up only pays for streamlit and pandas.
+HAS_OPENAI = importlib.util.find_spec("openai") is not None
+if not HAS_OPENAI:
     st.warning("OpenAI library not available. LLM mode will be disabled.")
 
-import textwrap
+import contextvars
+import hashlib
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import perf
+from engine import RecommendationEngine, format_rule_short
+from graph_layout import ProductGraph, to_html, to_svg
+from llm import CitationTracker, ClientStats, cross_check_citations, make_openai_client, run_completion
+from llm_cache import ResponseCache
 
 st.set_page_config(page_title="Aurora AI - Recomendador (Rules)", layout="wide")
 
 # -------------------------
-# 1) Reglas y estadísticas (datos provistos)
+# 1) Reglas y estadísticas
 # -------------------------
-RULES = [
-    {
-        "id": "R01",
-        "antecedent": [
-            "Tortillas de maíz Mixtas (Maíz de Corazón) - Docena",
-            "Kombucha de Cardamomo - 750 ml"
-        ],
-        "consequent": ["Kombucha de Jengibre - 750 ml"],
-        "support": 0.0106,
-        "confidence": 0.6737,
-        "lift": 16.28
-    },
-    {
-        "id": "R02",
-        "antecedent": ["Kombucha de Jengibre - 750 ml"],
-        "consequent": [
-            "Tortillas de maíz Mixtas (Maíz de Corazón) - Docena",
-            "Kombucha de Cardamomo - 750 ml"
-        ],
-        "support": 0.0106,
-        "confidence": 0.2560,
-        "lift": 16.28
-    },
-    {
-        "id": "R03",
-        "antecedent": [
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
-        ],
-        "consequent": [
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena",
-            "Fresa - domo de 450 gr - 450 gr"
-        ],
-        "support": 0.0103,
-        "confidence": 0.5299,
-        "lift": 15.62
-    },
-    {
-        "id": "R04",
-        "antecedent": [
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena",
-            "Fresa - domo de 450 gr - 450 gr"
-        ],
-        "consequent": [
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
-        ],
-        "support": 0.0103,
-        "confidence": 0.3024,
-        "lift": 15.62
-    },
-    {
-        "id": "R05",
-        "antecedent": [
-            "Fresa - domo de 450 gr - 450 gr",
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Blueberry - domo de 170 gr - 170 gr"
-        ],
-        "consequent": [
-            "Frambuesa - domo de 170 gr - 170 gr",
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena"
-        ],
-        "support": 0.0104,
-        "confidence": 0.4375,
-        "lift": 14.93
-    },
-    {
-        "id": "R06",
-        "antecedent": [
-            "Frambuesa - domo de 170 gr - 170 gr",
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena"
-        ],
-        "consequent": [
-            "Fresa - domo de 450 gr - 450 gr",
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Blueberry - domo de 170 gr - 170 gr"
-        ],
-        "support": 0.0104,
-        "confidence": 0.3559,
-        "lift": 14.93
-    },
-    {
-        "id": "R07",
-        "antecedent": [
-            "Fresa - domo de 450 gr - 450 gr",
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Blueberry - domo de 170 gr - 170 gr"
-        ],
-        "consequent": [
-            "Frambuesa - domo de 170 gr - 170 gr",
-            "Churros de amaranto natural con maíz y chía - 210 gr"
-        ],
-        "support": 0.0126,
-        "confidence": 0.5278,
-        "lift": 14.90
-    },
-    {
-        "id": "R08",
-        "antecedent": [
-            "Frambuesa - domo de 170 gr - 170 gr",
-            "Churros de amaranto natural con maíz y chía - 210 gr"
-        ],
-        "consequent": [
-            "Fresa - domo de 450 gr - 450 gr",
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Blueberry - domo de 170 gr - 170 gr"
-        ],
-        "support": 0.0126,
-        "confidence": 0.3551,
-        "lift": 14.90
-    },
-    {
-        "id": "R09",
-        "antecedent": [
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
-        ],
-        "consequent": [
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena",
-            "Fresa - domo de 450 gr - 450 gr"
-        ],
-        "support": 0.0103,
-        "confidence": 0.4429,
-        "lift": 14.70
-    },
-    {
-        "id": "R10",
-        "antecedent": [
-            "Churros de amaranto chipotle con maíz y chía - 210 gr",
-            "Huevo de Gallina - 12 pzas - Docena",
-            "Fresa - domo de 450 gr - 450 gr"
-        ],
-        "consequent": [
-            "Churros de amaranto natural con maíz y chía - 210 gr",
-            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
-        ],
-        "support": 0.0103,
-        "confidence": 0.3407,
-        "lift": 14.70
-    }
-]
-
-# Estadísticas generales que usaremos en prompts/respuestas
-STATS = {
-    "total_orders": 6042,
-    "unique_products": 774,
-    "avg_basket_size": 14.61,
-    "total_items_sold": 88303,
-    "top_products_support": [
-        ("Huevo de Gallina - 12 pzas - Docena", 0.577),
-        ("Nopal sin espina | 5 pzas - 5 piezas", 0.372),
-        ("Jitomate saladette - kg - kg", 0.351),
-        ("Blueberry - domo de 170 gr - 170 gr", 0.300),
-        ("Frambuesa - domo de 170 gr - 170 gr", 0.296)
-    ]
-}
-
-# Derivar lista de productos desde reglas y top products
-PRODUCTS = sorted({p for r in RULES for p in (r["antecedent"] + r["consequent"])} |
-                  {p for p, _ in STATS["top_products_support"]})
+# Toda la lógica vive en engine.py (compartida con api_server.py); la app solo renderiza.
+# Fuentes (por prioridad): AURORA_SNAPSHOT, AURORA_ORDERS_CSV o los datos provistos en rules_data.py.
+@st.cache_resource(show_spinner="Cargando reglas...")
+def load_engine(source_key):
+    return RecommendationEngine.from_env()
+
+
+ENGINE = load_engine(RecommendationEngine.source_key())
+STATS = ENGINE.stats
+# Streamlit reruns this script on every interaction: everything derived from the rules is cached
+# by RULES_VERSION so a click only pays for what actually changed.
+RULES_VERSION = ENGINE.version
+PRODUCT_DICT = ENGINE.products
 
 # -------------------------
 # 2) Helpers
 # -------------------------
 def rules_df():
-    rows = []
-    for r in RULES:
-        rows.append({
-            "id": r["id"],
-            "antecedent": " + ".join(r["antecedent"]),
-            "consequent": " + ".join(r["consequent"]),
-            "support": r["support"],
-            "confidence": r["confidence"],
-            "lift": r["lift"]
-        })
-    return pd.DataFrame(rows)
+    return ENGINE.rules_df()
 
 def find_products_in_text(text):
-    text_low = text.lower()
-    found = set()
-    # match by substring: most robust for product labels
-    for p in PRODUCTS:
-        if p.lower() in text_low:
-            found.add(p)
-    return sorted(found)
+    return ENGINE.find_products(text)
 
 def match_rules_by_products(products_set):
-    matched = []
-    for r in RULES:
-        antecedent_set = set(r["antecedent"])
-        # match if any antecedent product appears in user's text, but prefer full antecedent match when possible
-        if antecedent_set.issubset(products_set):
-            matched.append((r, "full"))
-        elif len(antecedent_set & products_set) > 0:
-            matched.append((r, "partial"))
-    # sort: full matches, then by lift desc
-    matched.sort(key=lambda x: (0 if x[1]=="full" else 1, -x[0]["lift"], -x[0]["confidence"]))
-    return matched
-
-def format_rule_short(r):
-    return f"{r['id']}: IF {' & '.join(r['antecedent'])} THEN {' & '.join(r['consequent'])} (support={r['support']:.4f}, conf={r['confidence']:.3f}, lift={r['lift']:.2f})"
+    return ENGINE.match_rules(products_set)
 
 # Simple local rule-based answer generator (Spanish)
 def rule_based_answer(question):
-    products = set(find_products_in_text(question))
-    if not products:
-        # No product mentioned -> provide top suggestions / bundles
-        top_bundles = [
-            ("R01", "Kombucha Duo + Tortillas", "Kombucha de Cardamomo + Kombucha de Jengibre + Tortillas Mixtas", "8-10%"),
-            ("R05", "Desayuno Antioxidante", "Huevos + Berries + Churros", "10% en tercer ítem"),
-            ("R03", "Proteína & Snack Picante", "Pollo + Churros chipotle + Fresa", "5-8% o envío gratis")
-        ]
-        lines = [
-            "No identifico productos explícitos en tu pregunta. Basado en el catálogo y reglas fuertes, sugiero:"
-        ]
-        for rid, title, cont, disc in top_bundles:
-            lines.append(f"- {title}: {cont} (sugerido {disc}; basada en {rid})")
-        return "\n".join(lines), []
-    else:
-        matched = match_rules_by_products(products)
-        if not matched:
-            return "Encontré productos, pero no hay reglas que los conecten directamente en las reglas cargadas. Puedes pedir sugerencias generales o pedir ver las reglas disponibles.", []
-        # Build answer with best matches (top 3)
-        answer_lines = []
-        cited = []
-        answer_lines.append(f"He detectado estos productos en tu consulta: {', '.join(products)}.")
-        answer_lines.append("Reglas relevantes (ordenadas por correspondencia y fuerza):")
-        for r, kind in matched[:6]:
-            cited.append(r["id"])
-            answer_lines.append(f"- {format_rule_short(r)} -- match={kind}")
-            # action suggestion
-            if r["lift"] > 10:
-                action = "Recomendado activar como bundle o cross-sell"
-            elif r["lift"] > 3:
-                action = "Considerar como recomendación contextual"
-            else:
-                action = "Útil como dato, baja prioridad para acción."
-            answer_lines.append(f"  → Acción sugerida: {action} (mostrar en PDP y carrito).")
-        return "\n".join(answer_lines), cited
-
-# Build system prompt for LLM mode (serializa reglas)
+    return ENGINE.rule_based_answer(question)
+
 def build_system_prompt():
-    header = (
-        "Eres un asistente en español especializado en recomendaciones de producto para una tienda.\n"
-        "Respond ONLY using the rules and statistics provided below. Do NOT invent facts or use external knowledge.\n"
-        "When you reference a rule in your answer, include its rule id(s) in square brackets (e.g. [R01]).\n"
-        "If the question cannot be answered using the rules or stats, say that no data is available and provide a safe, generic business suggestion.\n"
-        "Always answer in Spanish and be concise (2-6 frases)."
-    )
-    stats_block = "\nEstadísticas globales:\n"
-    stats_block += f"- Órdenes totales: {STATS['total_orders']}\n"
-    stats_block += f"- Productos únicos: {STATS['unique_products']}\n"
-    stats_block += f"- Tamaño promedio de carrito: {STATS['avg_basket_size']}\n"
-    stats_block += f"- Items vendidos totales: {STATS['total_items_sold']}\n"
-    stats_block += "- Top productos (soporte):\n"
-    for p, s in STATS["top_products_support"]:
-        stats_block += f"  * {p}: {s:.3f}\n"
-
-    rules_text = "\nReglas (ID, antecedente => consecuente, support, confidence, lift):\n"
-    for r in RULES:
-        rules_text += (f"- {r['id']}: IF " + " + ".join(r['antecedent']) + " => " +
-                       " + ".join(r['consequent']) +
-                       f"  (support={r['support']:.4f}, confidence={r['confidence']:.4f}, lift={r['lift']:.2f})\n")
-
-    return header + stats_block + rules_text
+    return ENGINE.build_system_prompt()
+
+def summary_report():
+    return ENGINE.summary_report()
+
+# larger catalogs start filtered to the strongest products
+GRAPH_MAX_NODES = 150
+GRAPH_AUTO_RULES = 5000
+LLM_TEMPERATURE = 0.2
+LLM_WORKERS = 8
+
+
+@st.cache_resource
+def load_llm_cache():
+    # persistent across restarts; hit/miss counters live as long as the server process
+    return ResponseCache()
+
+
+LLM_CACHE = load_llm_cache()
+
+
+@st.cache_resource
+def llm_executor():
+    # shared by all sessions; API calls are I/O bound, so a few threads go a long way
+    return ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+
+LLM_EXECUTOR = llm_executor()
+
+
+def llm_stats():
+    if "llm_stats" not in st.session_state:
+        st.session_state.llm_stats = ClientStats()
+    return st.session_state.llm_stats
+
+
+def llm_client(api_key):
+    """One OpenAI client per session (and key): reruns reuse its keep-alive pool instead of a new TLS handshake."""
+    key_id = hashlib.sha1(api_key.encode("utf-8")).hexdigest()
+    if st.session_state.get("llm_client_key") != key_id:
+        previous = st.session_state.get("llm_client")
+        if previous is not None:
+            previous.close()
+        st.session_state.llm_client = make_openai_client(api_key, llm_stats())
+        st.session_state.llm_client_key = key_id
+    return st.session_state.llm_client
+
+def llm_answer_html(text):
+    return f"""
+        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+             color: white; padding: 1.5rem; border-radius: 15px; margin: 1rem 0;">
+            {text.replace(chr(10), "<br>")}
+        </div>
+    """
+
+def llm_citation_html(r):
+    return f"""
+        <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; 
+             border-radius: 10px; margin: 0.5rem 0; border-left: 3px solid #667eea;">
+            <strong>{format_rule_short(r)}</strong>
+        </div>
+    """
+
+def lift_cell_style(lift):
+    # same thresholds as the legend above the full table (no matplotlib needed, unlike background_gradient)
+    color = "#4CAF50" if lift > 10 else "#FF9800" if lift > 5 else "#f44336"
+    return f"background-color: {color}; color: white"
+
+# Cached views: the version argument is the cache key, the bodies read the module-level rules
+@st.cache_data
+def cached_rules_df(version):
+    return rules_df()
+
+@st.cache_data
+def cached_rules_csv(version):
+    return rules_df().to_csv(index=False).encode("utf-8")
+
+@st.cache_data
+def cached_summary_report(version):
+    return summary_report()
+
+@st.cache_resource(show_spinner="Calculando layout del grafo...")
+def cached_product_graph(version):
+    # the layout is the expensive part: computed once per rules version, filters only subset it
+    graph = ProductGraph.from_table(ENGINE.table)
+    graph.layout()
+    return graph
+
+@st.cache_data(show_spinner=False)
+def render_network_html(version, min_lift, max_nodes, focus):
+    graph = cached_product_graph(version)
+    nodes, edges = graph.select(min_lift, max_nodes, focus)
+    return to_html(to_svg(graph, PRODUCT_DICT.labels, nodes, edges)), len(nodes), len(edges)
 
 # -------------------------
 # 3) UI & Custom Styling
@@ -446,27 +305,49 @@ st.sidebar.markdown("""
 if HAS_OPENAI:
     st.sidebar.markdown("### 🤖 Modo de IA")
     mode = st.sidebar.selectbox("Selecciona el modo de respuesta:", 
-                               ["🧠 Rule-based (local)", "🤖 LLM (OpenAI)"], 
+                               ["🧠 Rule-based (local)", "🤖 LLM (OpenAI)", "⚡ Híbrido (reglas + LLM)"], 
                                index=0)
     
-    if "LLM" in mode:
+    if "Rule-based" not in mode:
         st.sidebar.markdown("### 🔑 Configuración OpenAI")
         api_key = st.sidebar.text_input("API Key de OpenAI:", type="password", 
                                        help="Tu clave privada para acceder a OpenAI")
         model_choice = st.sidebar.selectbox("Modelo:", ["gpt-3.5-turbo", "gpt-4o"], index=0)
         st.sidebar.info("💡 El modelo usa SOLO las reglas mostradas en la app")
+        stream_llm = st.sidebar.checkbox("Respuesta en streaming", value=True,
+                                         help="Muestra la respuesta token a token (menor tiempo al primer token)")
+        cache_stats = LLM_CACHE.stats()
+        cache_col1, cache_col2 = st.sidebar.columns(2)
+        cache_col1.metric("Caché hits", cache_stats["hits"], f"{cache_stats['hit_rate']:.0%}")
+        cache_col2.metric("Caché misses", cache_stats["misses"], f"{cache_stats['entries']} guardadas")
+        client_stats = llm_stats().as_dict()
+        api_col1, api_col2 = st.sidebar.columns(2)
+        api_col1.metric("Llamadas API", client_stats["calls"], f"{client_stats['retries']} reintentos", delta_color="off")
+        api_col2.metric("Latencia p50", "–" if client_stats["p50_ms"] is None else f"{client_stats['p50_ms']:,.0f} ms",
+                        None if client_stats["p95_ms"] is None else f"p95 {client_stats['p95_ms']:,.0f} ms",
+                        delta_color="off")
+        if client_stats["rate_limited"] or client_stats["server_errors"] or client_stats["failures"]:
+            st.sidebar.caption(f"429: {client_stats['rate_limited']} · 5xx: {client_stats['server_errors']} · "
+                               f"fallidas: {client_stats['failures']}")
     else:
         api_key = None
         model_choice = None
+        stream_llm = False
 else:
     mode = "🧠 Rule-based (local)"
     st.sidebar.warning("⚠️ OpenAI no disponible. Solo modo rule-based.")
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📊 Datos del Sistema")
-st.sidebar.metric("Reglas Activas", "10", "Top performers")
-st.sidebar.metric("Productos", "774", "En catálogo")
-st.sidebar.metric("Órdenes", "6,042", "Analizadas")
+st.sidebar.metric("Reglas Activas", f"{len(ENGINE):,}", "Top performers")
+st.sidebar.metric("Productos", f"{STATS['unique_products']:,}", "En catálogo")
+st.sidebar.metric("Órdenes", f"{STATS['total_orders']:,}", "Analizadas")
+
+st.sidebar.markdown("---")
+# per session: only this session's queries are traced; the process-wide flag is AURORA_PERF=1
+show_perf = st.sidebar.checkbox("⏱️ Panel de rendimiento", value=perf.enabled(),
+                                help="Tiempos por etapa: detección, match, prompt, OpenAI y render")
+perf_box = st.sidebar.container()
 
 # Show main stats and quick actions with beautiful cards
 col1, col2 = st.columns([2, 1])
@@ -478,35 +359,35 @@ with col1:
     metrics_col1, metrics_col2 = st.columns(2)
     
     with metrics_col1:
-        st.markdown("""
+        st.markdown(f"""
             <div class="metric-container">
                 <div style="color: #667eea; font-size: 2.5rem; margin: 0;">📦</div>
-                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">6,042</div>
+                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">{STATS['total_orders']:,}</div>
                 <div style="color: #666; font-size: 0.9rem;">Órdenes Totales</div>
             </div>
         """, unsafe_allow_html=True)
         
-        st.markdown("""
+        st.markdown(f"""
             <div class="metric-container">
                 <div style="color: #667eea; font-size: 2.5rem; margin: 0;">🛍️</div>
-                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">14.61</div>
+                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">{STATS['avg_basket_size']:.2f}</div>
                 <div style="color: #666; font-size: 0.9rem;">Items Promedio por Carrito</div>
             </div>
         """, unsafe_allow_html=True)
     
     with metrics_col2:
-        st.markdown("""
+        st.markdown(f"""
             <div class="metric-container">
                 <div style="color: #667eea; font-size: 2.5rem; margin: 0;">🎯</div>
-                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">774</div>
+                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">{STATS['unique_products']:,}</div>
                 <div style="color: #666; font-size: 0.9rem;">Productos Únicos</div>
             </div>
         """, unsafe_allow_html=True)
         
-        st.markdown("""
+        st.markdown(f"""
             <div class="metric-container">
                 <div style="color: #667eea; font-size: 2.5rem; margin: 0;">📊</div>
-                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">88,303</div>
+                <div style="font-size: 2rem; font-weight: bold; color: #333; margin: 0.5rem 0;">{STATS['total_items_sold']:,}</div>
                 <div style="color: #666; font-size: 0.9rem;">Items Vendidos</div>
             </div>
         """, unsafe_allow_html=True)
@@ -541,7 +422,7 @@ with col2:
     st.markdown("### 🎯 Acciones Rápidas")
     
     if st.button("📋 Ver Todas las Reglas"):
-        st.dataframe(rules_df(), height=320)
+        st.dataframe(cached_rules_df(RULES_VERSION), height=320)
     
     st.markdown("""
         <div style="background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%); 
@@ -563,43 +444,34 @@ with col2:
         </div>
     """, unsafe_allow_html=True)
 
-# Network graph visualization (only if libraries are available)
-if HAS_GRAPH_LIBS:
-    st.markdown("### 🔗 Mapa de Conexiones de Productos")
-    st.markdown("""
-        <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; border-radius: 10px; margin: 1rem 0;">
-            💡 <strong>Visualización interactiva:</strong> Cada línea representa una relación fuerte entre productos. 
-            Los productos más conectados son candidatos ideales para promociones cruzadas.
-        </div>
-    """, unsafe_allow_html=True)
-    
-    G = nx.Graph()
-    # add nodes and edges derived from RULES (simplified: each antecedent and consequent added, connect antecedent->consequent)
-    for r in RULES:
-        for a in r["antecedent"]:
-            for c in r["consequent"]:
-                G.add_node(a)
-                G.add_node(c)
-                G.add_edge(a, c)
-    
-    fig, ax = plt.subplots(figsize=(12, 8))
-    fig.patch.set_facecolor('white')
-    ax.set_facecolor('white')
-    
-    pos = nx.spring_layout(G, seed=42, k=0.6)
-    
-    # Draw with beautiful colors
-    nx.draw_networkx_nodes(G, pos, node_color='#667eea', node_size=1000, alpha=0.8, ax=ax)
-    nx.draw_networkx_edges(G, pos, edge_color='#a8edea', alpha=0.6, width=2, ax=ax)
-    nx.draw_networkx_labels(G, pos, font_size=8, font_color='white', font_weight='bold', ax=ax)
-    
-    ax.set_title("Red de Productos Relacionados", fontsize=16, fontweight='bold', pad=20)
-    ax.axis('off')
-    
-    st.pyplot(fig, use_container_width=True)
-else:
-    st.markdown("### 🔗 Visualización de Red")
-    st.info("💡 La visualización de grafo requiere NetworkX y Matplotlib para mostrar las conexiones entre productos")
+# Network graph visualization: precomputed layout, rendered as interactive SVG
+st.markdown("### 🔗 Mapa de Conexiones de Productos")
+st.markdown("""
+    <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; border-radius: 10px; margin: 1rem 0;">
+        💡 <strong>Visualización interactiva:</strong> Cada flecha va del antecedente al consecuente; su grosor es el lift. 
+        Los productos más conectados son candidatos ideales para promociones cruzadas. Zoom con la rueda, arrastra para mover.
+    </div>
+""", unsafe_allow_html=True)
+
+# the layout is computed on first use; large rule sets start with the map folded
+# closed-itemset mode keeps only itemsets in memory: the map (full rule set) waits for an explicit click
+show_graph = st.checkbox("Mostrar mapa", value=ENGINE.itemsets is None and len(ENGINE) <= GRAPH_AUTO_RULES)
+graph = cached_product_graph(RULES_VERSION) if show_graph else None
+if graph is not None and not len(graph):
+    st.info("No hay reglas cargadas para dibujar el mapa (prueba con umbrales de minería más bajos).")
+elif graph is not None:
+    graph_col1, graph_col2, graph_col3 = st.columns([1, 1, 2])
+    with graph_col1:
+        graph_min_lift = st.slider("Lift mínimo", 0.0, float(max(1.0, graph.lift.max())), 0.0, 0.5)
+    with graph_col2:
+        graph_max_nodes = st.number_input("Máx. productos", min_value=5, max_value=max(5, len(graph)),
+                                          value=min(max(5, len(graph)), GRAPH_MAX_NODES), step=5)
+    with graph_col3:
+        graph_focus = st.multiselect("Enfocar en productos", sorted(PRODUCT_DICT.decode(graph.nodes)))
+    network_html, shown_nodes, shown_edges = render_network_html(
+        RULES_VERSION, graph_min_lift, int(graph_max_nodes), tuple(PRODUCT_DICT.encode(graph_focus).tolist()))
+    components.html(network_html, height=620)
+    st.caption(f"{shown_nodes:,} de {len(graph):,} productos · {shown_edges:,} de {len(graph.src):,} conexiones")
 
 st.markdown("---")
 
@@ -657,156 +529,203 @@ send_col1, send_col2, send_col3 = st.columns([1, 2, 1])
 with send_col2:
     send_button = st.button("🚀 Consultar a Aurora AI", use_container_width=True)
 
-if send_button:
-    if not query.strip():
-        st.warning("⚠️ Por favor, escribe una pregunta para que pueda ayudarte.")
-    else:
-        # Show loading with spinner
-        with st.spinner("🧠 Aurora AI está analizando tu consulta..."):
-            if "Rule-based" in mode:
-                answer, cited = rule_based_answer(query)
-                
-                # Beautiful response card
-                st.markdown("""
-                    <div class="response-card">
-                        <h3 style="color: #667eea; margin-top: 0;">
-                            🤖 Respuesta de Aurora AI (Análisis Local)
-                        </h3>
-                    </div>
-                """, unsafe_allow_html=True)
-                
+@perf.timed("render.rule_answer")
+def render_rule_answer(answer, cited):
+    answer_html = answer.replace("\n", "<br>")
+
+    # Beautiful response card
+    st.markdown("""
+        <div class="response-card">
+            <h3 style="color: #667eea; margin-top: 0;">
+                🤖 Respuesta de Aurora AI (Análisis Local)
+            </h3>
+        </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown(f"""
+        <div style="background: #f8f9ff; padding: 1.5rem; border-radius: 10px; 
+             border-left: 4px solid #667eea; margin: 1rem 0;">
+            {answer_html}
+        </div>
+    """, unsafe_allow_html=True)
+
+    if show_rule_matches and cited:
+        st.markdown("### 📋 Reglas Utilizadas")
+        for i, r in enumerate(cited):
+            if r:
+                confidence_color = "#4CAF50" if r["confidence"] > 0.5 else "#FF9800" if r["confidence"] > 0.3 else "#f44336"
+                lift_color = "#4CAF50" if r["lift"] > 10 else "#FF9800" if r["lift"] > 5 else "#f44336"
+
                 st.markdown(f"""
-                    <div style="background: #f8f9ff; padding: 1.5rem; border-radius: 10px; 
-                         border-left: 4px solid #667eea; margin: 1rem 0;">
-                        {answer.replace('\n', '<br>')}
+                    <div style="background: white; padding: 1rem; border-radius: 10px; 
+                         margin: 0.5rem 0; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
+                        <div style="display: flex; justify-content: between; align-items: center; margin-bottom: 0.5rem;">
+                            <span style="background: #667eea; color: white; padding: 0.2rem 0.8rem; 
+                                 border-radius: 15px; font-size: 0.8rem; font-weight: bold;">{r["id"]}</span>
+                            <div style="display: flex; gap: 1rem; margin-left: auto;">
+                                <span style="background: {confidence_color}; color: white; padding: 0.2rem 0.6rem; 
+                                     border-radius: 10px; font-size: 0.7rem;">Conf: {r["confidence"]:.3f}</span>
+                                <span style="background: {lift_color}; color: white; padding: 0.2rem 0.6rem; 
+                                     border-radius: 10px; font-size: 0.7rem;">Lift: {r["lift"]:.2f}</span>
+                            </div>
+                        </div>
+                        <div style="color: #333; margin: 0.5rem 0;">
+                            <strong>Si:</strong> {' + '.join(r["antecedent"])}<br>
+                            <strong>Entonces:</strong> {' + '.join(r["consequent"])}
+                        </div>
                     </div>
                 """, unsafe_allow_html=True)
-                
-                if show_rule_matches and cited:
-                    st.markdown("### 📋 Reglas Utilizadas")
-                    for i, rid in enumerate(cited):
-                        r = next((x for x in RULES if x["id"] == rid), None)
-                        if r:
-                            confidence_color = "#4CAF50" if r["confidence"] > 0.5 else "#FF9800" if r["confidence"] > 0.3 else "#f44336"
-                            lift_color = "#4CAF50" if r["lift"] > 10 else "#FF9800" if r["lift"] > 5 else "#f44336"
-                            
-                            st.markdown(f"""
-                                <div style="background: white; padding: 1rem; border-radius: 10px; 
-                                     margin: 0.5rem 0; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                                    <div style="display: flex; justify-content: between; align-items: center; margin-bottom: 0.5rem;">
-                                        <span style="background: #667eea; color: white; padding: 0.2rem 0.8rem; 
-                                             border-radius: 15px; font-size: 0.8rem; font-weight: bold;">{r["id"]}</span>
-                                        <div style="display: flex; gap: 1rem; margin-left: auto;">
-                                            <span style="background: {confidence_color}; color: white; padding: 0.2rem 0.6rem; 
-                                                 border-radius: 10px; font-size: 0.7rem;">Conf: {r["confidence"]:.3f}</span>
-                                            <span style="background: {lift_color}; color: white; padding: 0.2rem 0.6rem; 
-                                                 border-radius: 10px; font-size: 0.7rem;">Lift: {r["lift"]:.2f}</span>
-                                        </div>
-                                    </div>
-                                    <div style="color: #333; margin: 0.5rem 0;">
-                                        <strong>Si:</strong> {' + '.join(r["antecedent"])}<br>
-                                        <strong>Entonces:</strong> {' + '.join(r["consequent"])}
-                                    </div>
-                                </div>
-                            """, unsafe_allow_html=True)
-            else:
-                # LLM mode -> need API key and OpenAI library
-                if not HAS_OPENAI:
-                    st.error("❌ La librería OpenAI no está disponible. Instala 'openai' para usar el modo LLM.")
-                elif not api_key:
-                    st.error("🔑 Para usar el modo LLM, ingresa tu API key de OpenAI en la barra lateral.")
-                else:
-                    try:
-                        # Updated for newer OpenAI library versions
-                        from openai import OpenAI
-                        client = OpenAI(api_key=api_key)
-                        
-                        system_prompt = build_system_prompt()
-                        user_prompt = (
-                            "Pregunta del usuario (español):\n"
-                            + query
-                            + "\n\nRespond in Spanish. Use ONLY the rules and stats provided. Cite rule ids used in [RXX] format."
-                        )
-                        
-                        response = client.chat.completions.create(
-                            model=model_choice,
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_prompt}
-                            ],
-                            temperature=0.2,
-                            max_tokens=600,
-                        )
-                        
-                        llm_text = response.choices[0].message.content.strip()
-                        
-                        # Beautiful LLM response
-                        st.markdown("""
-                            <div class="response-card">
-                                <h3 style="color: #667eea; margin-top: 0;">
-                                    🤖 Respuesta de Aurora AI (Powered by OpenAI)
-                                </h3>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        st.markdown(f"""
-                            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                                 color: white; padding: 1.5rem; border-radius: 15px; margin: 1rem 0;">
-                                {llm_text.replace('\n', '<br>')}
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Extract and display referenced rules
-                        import re
-                        refs = re.findall(r"\[R0?\d{1,2}\]", llm_text)
-                        refs = [r.strip("[]") for r in refs]
-                        if show_rule_matches and refs:
-                            st.markdown("### 📊 Reglas Citadas por el Modelo")
-                            for rid in refs:
-                                r = next((x for x in RULES if x["id"] == rid), None)
-                                if r:
-                                    st.markdown(f"""
-                                        <div style="background: rgba(102, 126, 234, 0.1); padding: 1rem; 
-                                             border-radius: 10px; margin: 0.5rem 0; border-left: 3px solid #667eea;">
-                                            <strong>{format_rule_short(r)}</strong>
-                                        </div>
-                                    """, unsafe_allow_html=True)
-                                    
-                    except Exception as e:
-                        st.error(f"❌ Error al conectar con OpenAI: {str(e)}")
-                        st.info("💡 Verifica que tu API key sea correcta y tengas créditos disponibles.")_prompt = build_system_prompt()
-                        user_prompt = (
-                            "Pregunta del usuario (español):\n"
-                            + query
-                            + "\n\nRespond in Spanish. Use ONLY the rules and stats provided. Cite rule ids used in [RXX] format."
-                        )
-                        
-                        response = client.chat.completions.create(
-                            model=model_choice,
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_prompt}
-                            ],
-                            temperature=0.2,
-                            max_tokens=600,
-                        )
-                        
-                        llm_text = response.choices[0].message.content.strip()
-                        st.markdown("### Respuesta (LLM usando reglas)")
-                        st.write(llm_text)
-                        
-                        # Attempt to extract referenced rules from the response (look for [Rxx])
-                        import re
-                        refs = re.findall(r"\[R0?\d{1,2}\]", llm_text)
-                        refs = [r.strip("[]") for r in refs]
-                        if show_rule_matches and refs:
-                            st.markdown("**Reglas citadas por el modelo:**")
-                            for rid in refs:
-                                r = next((x for x in RULES if x["id"] == rid), None)
-                                if r:
-                                    st.write(format_rule_short(r))
-                    except Exception as e:
-                        st.error(f"Error llamando a OpenAI: {e}")
+
+
+def start_llm_answer(query):
+    """Build the prompt, look up the cache and, on a miss, launch the API call on the worker pool."""
+    # only the rules retrieved for this question go into the prompt (token budget)
+    system_prompt, prompt_info = ENGINE.build_scoped_prompt(query)
+    # same question + model + temperature + rules prompt -> stored answer, no API call
+    cache_key = LLM_CACHE.make_key(query, model_choice, LLM_TEMPERATURE, system_prompt)
+    job = {"prompt_info": prompt_info, "cache_key": cache_key, "cached_text": LLM_CACHE.get(cache_key),
+           "started": time.perf_counter(), "future": None, "deltas": queue.Queue()}
+    if job["cached_text"] is None:
+        user_prompt = (
+            "Pregunta del usuario (español):\n"
+            + query
+            + "\n\nRespond in Spanish. Use ONLY the rules and stats provided. Cite rule ids used in [RXX] format."
+        )
+        request = dict(
+            model=model_choice,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=LLM_TEMPERATURE,
+            max_tokens=600,
+        )
+        # the worker thread never touches Streamlit: it only fills the deltas queue
+        # copy_context: the worker's spans land in this request's trace
+        job["future"] = LLM_EXECUTOR.submit(contextvars.copy_context().run, run_completion, llm_client(api_key),
+                                            request, stream_llm, job["deltas"], llm_stats())
+    return job
+
+
+@perf.timed("render.llm_answer")
+def render_llm_answer(query, job, rule_cited=None):
+    """Render a job from ``start_llm_answer``; with ``rule_cited`` (rule dicts) also cross-check both answers' rules."""
+    from_cache = job["cached_text"] is not None
+    prompt_info = job["prompt_info"]
+
+    # Beautiful LLM response
+    st.markdown(f"""
+        <div class="response-card">
+            <h3 style="color: #667eea; margin-top: 0;">
+                🤖 Respuesta de Aurora AI (Powered by OpenAI){" ⚡ caché" if from_cache else ""}
+            </h3>
+        </div>
+    """, unsafe_allow_html=True)
+    answer_box = st.empty()
+    caption_box = st.empty()
+    citations_box = st.container()
+    tracker = CitationTracker()
+
+    shown_refs = []
+
+    def show_citations(rule_ids):
+        # cards appear as soon as a citation is complete in the streamed text
+        if not show_rule_matches:
+            return
+        for rid in rule_ids:
+            # the model may only cite rules that were in its prompt
+            r = prompt_info["rules_by_id"].get(rid)
+            if r:
+                if not shown_refs:
+                    citations_box.markdown("### 📊 Reglas Citadas por el Modelo")
+                shown_refs.append(rid)
+                citations_box.markdown(llm_citation_html(r), unsafe_allow_html=True)
+
+    first_token_seconds = None
+    if from_cache:
+        show_citations(tracker.feed(job["cached_text"]))
+    else:
+        answer_box.markdown(llm_answer_html("⏳ Generando respuesta..."), unsafe_allow_html=True)
+        while True:
+            delta = job["deltas"].get()
+            if delta is None:
+                break
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - job["started"]
+            new_refs = tracker.feed(delta)
+            answer_box.markdown(llm_answer_html(tracker.text + " ▌"), unsafe_allow_html=True)
+            show_citations(new_refs)
+        # re-raises API errors from the worker
+        job["future"].result()
+        # an empty stream is not an answer; caching it would show a blank reply until the TTL expires
+        if tracker.text.strip():
+            LLM_CACHE.put(job["cache_key"], tracker.text.strip(), query, model_choice)
+    llm_seconds = time.perf_counter() - job["started"]
+
+    answer_box.markdown(llm_answer_html(tracker.text.strip()), unsafe_allow_html=True)
+    timing = "respuesta desde caché" if from_cache else f"LLM {llm_seconds * 1000:,.0f} ms"
+    if first_token_seconds is not None and stream_llm:
+        timing += f" (primer token {first_token_seconds * 1000:,.0f} ms)"
+    caption_box.caption(
+        f"Prompt: {prompt_info['rules']}/{prompt_info['rules_total']:,} reglas, "
+        f"~{prompt_info['tokens']:,} tokens · recuperación {prompt_info['retrieval_ms']:.1f} ms · "
+        + timing
+    )
+    if rule_cited is not None:
+        check = cross_check_citations(tracker.cited, [r["id"] for r in rule_cited], prompt_info["rule_ids"])
+        lines = [f"✅ Coinciden: {', '.join(check['agreed']) or '—'}"]
+        if check["llm_only"]:
+            lines.append(f"🤖 Solo LLM: {', '.join(check['llm_only'])}")
+        if check["rules_only"]:
+            lines.append(f"🧠 Solo reglas: {', '.join(check['rules_only'])}")
+        if check["unknown"]:
+            lines.append(f"⚠️ Citas fuera del prompt (posible invención): {', '.join(check['unknown'])}")
+        st.markdown("### 🔍 Contraste de Citas")
+        st.markdown("<br>".join(lines), unsafe_allow_html=True)
+
+
+if send_button:
+    with perf.request("chat", enabled=show_perf, mode=mode) as perf_trace:
+        if not query.strip():
+            st.warning("⚠️ Por favor, escribe una pregunta para que pueda ayudarte.")
+        elif "Rule-based" not in mode and not HAS_OPENAI:
+            st.error("❌ La librería OpenAI no está disponible. Instala 'openai' para usar el modo LLM.")
+        elif "Rule-based" not in mode and not api_key:
+            st.error("🔑 Para usar el modo LLM, ingresa tu API key de OpenAI en la barra lateral.")
+        elif "Rule-based" in mode:
+            # Show loading with spinner
+            with st.spinner("🧠 Aurora AI está analizando tu consulta..."):
+                render_rule_answer(*rule_based_answer(query))
+        else:
+            try:
+                # hybrid: the API call runs on the worker pool while the local answer renders right away
+                job = start_llm_answer(query)
+                rule_cited = None
+                if "Híbrido" in mode:
+                    rule_answer, rule_cited = rule_based_answer(query)
+                    render_rule_answer(rule_answer, rule_cited)
+                render_llm_answer(query, job, rule_cited)
+
+            except Exception as e:
+                st.error(f"❌ Error al conectar con OpenAI: {str(e)}")
+                st.info("💡 Verifica que tu API key sea correcta y tengas créditos disponibles.")
+    if perf_trace is not None:
+        st.session_state.last_perf_trace = perf_trace.as_dict()
+
+if show_perf:
+    with perf_box:
+        st.markdown("### ⏱️ Rendimiento")
+        last_trace = st.session_state.get("last_perf_trace")
+        if last_trace:
+            st.caption(f"Última consulta: {last_trace['total_ms']:,.1f} ms")
+            st.dataframe(pd.DataFrame(last_trace["spans"]), hide_index=True, use_container_width=True)
+        summary = perf.RECORDER.summary()
+        if summary:
+            st.caption("Acumulado del proceso")
+            st.dataframe(pd.DataFrame(summary)[["span", "count", "p50_ms", "p95_ms", "max_ms"]],
+                         hide_index=True, use_container_width=True)
+        elif not last_trace:
+            st.caption("Haz una consulta para ver los tiempos por etapa.")
 
 st.markdown("---")
 
@@ -823,11 +742,11 @@ if show_all_rules:
     """, unsafe_allow_html=True)
     
     # Style the dataframe
-    styled_df = rules_df().style.format({
+    styled_df = cached_rules_df(RULES_VERSION).style.format({
         'support': '{:.4f}',
         'confidence': '{:.3f}', 
         'lift': '{:.2f}'
-    }).background_gradient(subset=['lift'], cmap='RdYlGn')
+    }).map(lift_cell_style, subset=['lift'])
     
     st.dataframe(styled_df, height=400, use_container_width=True)
 
@@ -835,43 +754,30 @@ if show_all_rules:
 st.markdown("---")
 st.markdown("### 📥 Exportar Datos")
 
+# the CSV and report cover the whole rule set: built only once the user asks for them
+prepare_exports = st.checkbox("Preparar archivos de exportación", value=False)
+
 col_download1, col_download2, col_download3 = st.columns(3)
 
 with col_download1:
-    csv = rules_df().to_csv(index=False).encode("utf-8")
-    st.download_button(
-        "📊 Descargar Reglas CSV", 
-        data=csv, 
-        file_name="aurora_ai_rules.csv", 
-        mime="text/csv",
-        use_container_width=True
-    )
+    if prepare_exports:
+        st.download_button(
+            "📊 Descargar Reglas CSV", 
+            data=cached_rules_csv(RULES_VERSION), 
+            file_name="aurora_ai_rules.csv", 
+            mime="text/csv",
+            use_container_width=True
+        )
 
 with col_download2:
-    # Create a summary report
-    summary_text = f"""
-Aurora AI - Reporte de Reglas de Asociación
-
-Estadísticas Generales:
-- Órdenes analizadas: {STATS['total_orders']:,}
-- Productos únicos: {STATS['unique_products']:,}
-- Promedio items por carrito: {STATS['avg_basket_size']:.2f}
-- Total items vendidos: {STATS['total_items_sold']:,}
-
-Top 5 Productos (por frecuencia):
-{chr(10).join([f"- {p}: {s:.1%}" for p, s in STATS['top_products_support']])}
-
-Reglas Top 10:
-{chr(10).join([f"- {r['id']}: Lift {r['lift']:.2f}, Conf {r['confidence']:.3f}" for r in RULES])}
-    """
-    
-    st.download_button(
-        "📄 Reporte Completo TXT",
-        data=summary_text,
-        file_name="aurora_ai_report.txt",
-        mime="text/plain",
-        use_container_width=True
-    )
+    if prepare_exports:
+        st.download_button(
+            "📄 Reporte Completo TXT",
+            data=cached_summary_report(RULES_VERSION),
+            file_name="aurora_ai_report.txt",
+            mime="text/plain",
+            use_container_width=True
+        )
 
 with col_download3:
     st.markdown("""
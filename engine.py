@@ -0,0 +1,380 @@
+"""
+Motor de recomendación independiente de la UI.
+- Carga reglas una vez (snapshot, export de órdenes o datos precargados) y responde en memoria.
+- Lo usan la app de Streamlit (chatbot.py) y el servicio HTTP (api_server.py).
+- Con un snapshot de itemsets cerrados (itemsets.py) deriva las reglas de cada canasta al consultar.
+"""
+
+import math
+import os
+import time
+
+import numpy as np
+
+import rules_data
+from perf import span, timed
+from product_matcher import MIN_HEAD_WORD_LEN, ProductMatcher, normalize
+from products import ProductDictionary
+from ranking import rank_consequents
+from rule_store import RuleStore, RuleTable, rules_fingerprint
+
+MAX_ANSWER_RULES = 6
+# LLM prompts carry only the rules retrieved for the question (see build_scoped_prompt)
+MAX_PROMPT_RULES = 40
+PROMPT_TOKEN_BUDGET = 3000
+RULES_HEADER = "\nReglas (ID, antecedente => consecuente, support, confidence, lift):\n"
+
+
+def format_rule_short(r):
+    return f"{r['id']}: IF {' & '.join(r['antecedent'])} THEN {' & '.join(r['consequent'])} (support={r['support']:.4f}, conf={r['confidence']:.3f}, lift={r['lift']:.2f})"
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for Spanish/English text; good enough for budgeting
+    return math.ceil(len(text) / 4)
+
+
+def suggested_action(lift):
+    if lift > 10:
+        return "Recomendado activar como bundle o cross-sell"
+    if lift > 3:
+        return "Considerar como recomendación contextual"
+    return "Útil como dato, baja prioridad para acción."
+
+
+class RecommendationEngine:
+    def __init__(self, store, stats, version, aliases=None, itemsets=None):
+        # closed-itemset mode (itemsets.py): ``store`` may be None; basket queries derive their rules
+        self._store = store
+        self.itemsets = itemsets
+        self.stats = stats
+        self.version = version
+        self.products = (itemsets if store is None else store.table).products
+        self.matcher = ProductMatcher(self.products, aliases)
+        self._words = None
+        self._order = None
+
+    @classmethod
+    def from_rules(cls, rules, stats, aliases=None, version=None):
+        products = ProductDictionary.from_rules(rules, stats)
+        store = RuleStore(RuleTable.from_rules(rules, products))
+        return cls(store, stats, version or rules_fingerprint(rules, stats), aliases)
+
+    @classmethod
+    def from_snapshot(cls, path, aliases=None):
+        from snapshot import KIND_CLOSED, Snapshot
+
+        # memory-mapped: several worker processes share one page-cache copy
+        snap = Snapshot(path)
+        if snap.kind == KIND_CLOSED:
+            return cls(None, snap.stats, snap.rules_version, aliases, itemsets=snap.closed_itemsets())
+        return cls(snap.rule_store(), snap.stats, snap.rules_version, aliases)
+
+    @classmethod
+    def from_orders(cls, path, min_support=0.01, min_confidence=0.2, n_jobs=1, aliases=None):
+        from ingest import mine_file
+
+        rules, stats, _ = mine_file(path, min_support=min_support, min_confidence=min_confidence, n_jobs=n_jobs)
+        # the mining inputs identify the rule set; avoids rehashing a large mined output
+        version = rules_fingerprint(path, os.path.getmtime(path), min_support, min_confidence)
+        return cls.from_rules(rules, stats, aliases, version)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Rule source by priority: AURORA_SNAPSHOT, AURORA_ORDERS_CSV, then rules_data literals."""
+        environ = os.environ if environ is None else environ
+        aliases = rules_data.PRODUCT_ALIASES
+        if environ.get("AURORA_SNAPSHOT"):
+            return cls.from_snapshot(environ["AURORA_SNAPSHOT"], aliases)
+        if environ.get("AURORA_ORDERS_CSV"):
+            return cls.from_orders(
+                environ["AURORA_ORDERS_CSV"],
+                float(environ.get("AURORA_MIN_SUPPORT", "0.01")),
+                float(environ.get("AURORA_MIN_CONFIDENCE", "0.2")),
+                int(environ.get("AURORA_MINER_JOBS", "1")),
+                aliases,
+            )
+        return cls.from_rules(rules_data.RULES, rules_data.STATS, aliases)
+
+    @staticmethod
+    def source_key(environ=None):
+        """Cheap identity of the configured rule source (used as a cache key by callers)."""
+        environ = os.environ if environ is None else environ
+        for var in ("AURORA_SNAPSHOT", "AURORA_ORDERS_CSV"):
+            path = environ.get(var)
+            if path:
+                return (var, path, os.path.getmtime(path), environ.get("AURORA_MIN_SUPPORT"),
+                        environ.get("AURORA_MIN_CONFIDENCE"))
+        return ("builtin",)
+
+    def __len__(self):
+        return self.itemsets.n_rules if self._store is None else len(self._store)
+
+    @property
+    def store(self):
+        # closed-itemset mode builds the full rule set only for whole-table consumers (prompt, graph, df)
+        if self._store is None:
+            with span("engine.materialize_rules"):
+                self._store = RuleStore(self.itemsets.rule_table())
+        return self._store
+
+    @property
+    def table(self):
+        return self.store.table
+
+    def basket_store(self, items, partial=True):
+        """RuleStore to match ``items`` against: the full store, or in closed-itemset mode one holding
+        only the rules derived for them (``partial=False``: only rules whose antecedent is inside them)."""
+        if self.itemsets is None or self._store is not None:
+            return self.store
+        with span("engine.derive_rules"):
+            return RuleStore(self.itemsets.basket_rules(items, partial))
+
+    def get_rule(self, rule_id):
+        # closed-itemset mode: builds the full rule set; answers and prompts return their rule dicts instead
+        return self.store.get(rule_id)
+
+    @timed("engine.find_products")
+    def find_product_ids(self, text):
+        return self.matcher.find_ids(text)
+
+    @timed("engine.find_products")
+    def find_products(self, text):
+        # single pass over the normalized text (accents/case/aliases handled by the automaton)
+        return self.matcher.find(text)
+
+    @timed("engine.match_rules")
+    def match_rules(self, products, limit=None):
+        # inverted index lookup: full antecedent matches first, then partial, each by lift/confidence desc
+        return self.basket_store(self.products.encode(products)).match(products, limit)
+
+    def recommend(self, basket, k=5, fusion="max_lift", partial_weight=0.0):
+        """Ranked consequents for a basket of product labels: ``[{"product", "score", "rules"}]``.
+
+        Products already in the basket are skipped; see ranking.rank_consequents for ``fusion``.
+        """
+        return self.recommend_ids(self.products.encode(basket), k, fusion, partial_weight)
+
+    def recommend_ids(self, items, k=5, fusion="max_lift", partial_weight=0.0):
+        return self._recommend(self.basket_store(items, partial=partial_weight > 0), items, k, fusion, partial_weight)
+
+    @timed("engine.recommend")
+    def _recommend(self, store, items, k, fusion, partial_weight):
+        rule_idx, partial = store.match_ids(items)
+        ranked = rank_consequents(store.table, rule_idx, partial, items, k, fusion, partial_weight)
+        ids = store.table.ids
+        return [{"product": self.products.labels[item], "score": round(score, 4), "rules": [str(ids[i]) for i in rules]}
+                for item, score, rules in ranked]
+
+    @timed("engine.rule_based_answer")
+    def rule_based_answer(self, question):
+        """``(answer text, cited rule dicts)`` built from the rules matching the products in ``question``."""
+        # work on product ids; labels are decoded only for the answer text
+        product_ids = self.find_product_ids(question)
+        if not product_ids:
+            # No product mentioned -> the strongest loaded rules as bundles (closed-itemset mode:
+            # the strongest of those derived for the top-selling products)
+            store = self.basket_store(self._top_product_ids())
+            bundles, seen = [], set()
+            for i in self._strength_order(store).tolist():
+                r = store.table.rule(i)
+                # A => B and B => A are the same bundle
+                key = frozenset(r["antecedent"] + r["consequent"])
+                if key not in seen:
+                    seen.add(key)
+                    bundles.append(r)
+                    if len(bundles) == 3:
+                        break
+            if not bundles:
+                return "No identifico productos explícitos en tu pregunta y no hay reglas cargadas para sugerir bundles.", []
+            lines = [
+                "No identifico productos explícitos en tu pregunta. Basado en el catálogo y reglas fuertes, sugiero:"
+            ]
+            for r in bundles:
+                lines.append(f"- {' + '.join(r['antecedent'] + r['consequent'])} (lift {r['lift']:.2f}: "
+                             f"{suggested_action(r['lift'])}; basada en {r['id']})")
+            return "\n".join(lines), bundles
+
+        store = self.basket_store(product_ids)
+        with span("engine.match_rules"):
+            rule_idx, partial = store.match_ids(product_ids)
+        matched = [(store.table.rule(i), "partial" if p else "full")
+                   for i, p in zip(rule_idx[:MAX_ANSWER_RULES].tolist(), partial[:MAX_ANSWER_RULES].tolist())]
+        if not matched:
+            return "Encontré productos, pero no hay reglas que los conecten directamente en las reglas cargadas. Puedes pedir sugerencias generales o pedir ver las reglas disponibles.", []
+        answer_lines = []
+        # rule dicts come from the store the basket was matched on (no lookup in the full rule set)
+        cited = {}
+        answer_lines.append(f"He detectado estos productos en tu consulta: {', '.join(self.products.decode(product_ids))}.")
+        answer_lines.append("Reglas relevantes (ordenadas por correspondencia y fuerza):")
+        for r, kind in matched:
+            cited[r["id"]] = r
+            answer_lines.append(f"- {format_rule_short(r)} -- match={kind}")
+            answer_lines.append(f"  → Acción sugerida: {suggested_action(r['lift'])} (mostrar en PDP y carrito).")
+        # chat questions rarely name a whole antecedent, so partial matches count at half weight
+        suggestions = self._recommend(store, product_ids, 3, "max_lift", 0.5)
+        if suggestions:
+            answer_lines.append("Productos sugeridos para agregar al carrito:")
+            for s in suggestions:
+                answer_lines.append(f"- {s['product']} (score {s['score']:.2f}; basada en {', '.join(s['rules'][:3])})")
+                for rid in s["rules"][:3]:
+                    if rid not in cited:
+                        cited[rid] = store.get(rid)
+        return "\n".join(answer_lines), list(cited.values())
+
+    def _prompt_header(self):
+        return (
+            "Eres un asistente en español especializado en recomendaciones de producto para una tienda.\n"
+            "Respond ONLY using the rules and statistics provided below. Do NOT invent facts or use external knowledge.\n"
+            "When you reference a rule in your answer, include its rule id(s) in square brackets (e.g. [R01]).\n"
+            "If the question cannot be answered using the rules or stats, say that no data is available and provide a safe, generic business suggestion.\n"
+            "Always answer in Spanish and be concise (2-6 frases)."
+        )
+
+    def _stats_block(self):
+        stats = self.stats
+        stats_block = "\nEstadísticas globales:\n"
+        stats_block += f"- Órdenes totales: {stats['total_orders']}\n"
+        stats_block += f"- Productos únicos: {stats['unique_products']}\n"
+        stats_block += f"- Tamaño promedio de carrito: {stats['avg_basket_size']}\n"
+        stats_block += f"- Items vendidos totales: {stats['total_items_sold']}\n"
+        stats_block += "- Top productos (soporte):\n"
+        for p, s in stats["top_products_support"]:
+            stats_block += f"  * {p}: {s:.3f}\n"
+        return stats_block
+
+    def _rule_line(self, table, i):
+        return (f"- {table.ids[i]}: IF {' + '.join(self.products.decode(table.antecedent_items(i)))}"
+                f" => {' + '.join(self.products.decode(table.consequent_items(i)))}"
+                f"  (support={table.support[i]:.4f}, confidence={table.confidence[i]:.4f}, lift={table.lift[i]:.2f})\n")
+
+    @timed("engine.build_system_prompt")
+    def build_system_prompt(self):
+        # Build system prompt for LLM mode (serializa reglas)
+        table = self.table
+        rules_text = RULES_HEADER
+        for rid, antecedent, consequent, support, confidence, lift in zip(
+                table.ids, table.antecedent_strings(), table.consequent_strings(),
+                table.support, table.confidence, table.lift):
+            rules_text += (f"- {rid}: IF {antecedent} => {consequent}"
+                           f"  (support={support:.4f}, confidence={confidence:.4f}, lift={lift:.2f})\n")
+
+        return self._prompt_header() + self._stats_block() + rules_text
+
+    @property
+    def _word_index(self):
+        # normalized label word -> product ids, for products named loosely ("kombucha", "churros")
+        if self._words is None:
+            self._words = {}
+            for item, label in enumerate(self.products.labels):
+                for word in set(normalize(label).split()):
+                    if len(word) >= MIN_HEAD_WORD_LEN and not word.isdigit():
+                        self._words.setdefault(word, set()).add(item)
+        return self._words
+
+    def lexical_product_ids(self, text):
+        """Product ids sharing a (singularized) word with ``text``."""
+        found = set()
+        for word in normalize(text).split():
+            for form in {word, word[:-1], word[:-2]} if word.endswith("s") else {word}:
+                found |= self._word_index.get(form, set())
+        return found
+
+    def _top_product_ids(self):
+        return self.products.encode([p for p, _ in self.stats["top_products_support"]]).tolist()
+
+    def _strength_order(self, store):
+        if store is not self._store:
+            return np.argsort(store.rank, kind="stable")
+        if self._order is None:
+            self._order = np.argsort(store.rank, kind="stable")
+        return self._order
+
+    @timed("engine.retrieve_rules")
+    def retrieve_rules(self, question, max_rules=MAX_PROMPT_RULES):
+        """``(store, rule positions in it, detected product ids)`` for ``question``, most relevant first.
+
+        Tiers: full antecedent matches of the detected products, partial matches, rules leading to
+        them, rules touching products that only share a word with the question, then the strongest
+        rules overall as filler. Each tier is in strength order. In closed-itemset mode the store holds
+        only the rules derived for those products (the top products when none is named).
+        """
+        detected = self.find_product_ids(question)
+        lexical = sorted(self.lexical_product_ids(question) - set(detected))
+        named = list(detected) + lexical
+        if not named and self._store is None:
+            named = self._top_product_ids()
+        store = self.basket_store(named)
+        rule_idx, partial = store.match_ids(detected)
+        rank = store.rank
+        tiers = [rule_idx[~partial], rule_idx[partial]]
+        for rules in (store.rules_with_consequent(detected),
+                      np.union1d(store.match_ids(lexical)[0], store.rules_with_consequent(lexical))):
+            tiers.append(rules[np.argsort(rank[rules], kind="stable")])
+        tiers.append(self._strength_order(store)[:max_rules])
+        seen = set()
+        picked = []
+        for tier in tiers:
+            for i in tier.tolist():
+                if i not in seen:
+                    seen.add(i)
+                    picked.append(i)
+                    if len(picked) == max_rules:
+                        return store, picked, detected
+        return store, picked, detected
+
+    @timed("engine.build_scoped_prompt")
+    def build_scoped_prompt(self, question, max_rules=MAX_PROMPT_RULES, token_budget=PROMPT_TOKEN_BUDGET):
+        """System prompt with only the rules relevant to ``question``, kept under ``token_budget``.
+
+        Returns ``(prompt, info)``; ``info`` has the rule count, estimated tokens, retrieval time and
+        the prompt's rules by id (``rules_by_id``), so citations resolve without the full rule set.
+        """
+        started = time.perf_counter()
+        store, picked, detected = self.retrieve_rules(question, max_rules)
+        prompt = self._prompt_header() + self._stats_block()
+        if detected:
+            prompt += f"\nProductos detectados en la pregunta: {', '.join(self.products.decode(detected))}\n"
+        prompt += RULES_HEADER
+        tokens = estimate_tokens(prompt)
+        used = {}
+        for i in picked:
+            line = self._rule_line(store.table, i)
+            cost = estimate_tokens(line)
+            if tokens + cost > token_budget:
+                break
+            prompt += line
+            tokens += cost
+            used[str(store.table.ids[i])] = i
+        info = {
+            "rules": len(used),
+            "rules_total": len(self),
+            "rule_ids": list(used),
+            "rules_by_id": {rid: store.table.rule(i) for rid, i in used.items()},
+            "tokens": tokens,
+            "chars": len(prompt),
+            "retrieval_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return prompt, info
+
+    def rules_df(self):
+        # built straight from the columnar arrays, labels decoded once per column
+        return self.table.to_frame()
+
+    def summary_report(self):
+        stats, table = self.stats, self.table
+        return f"""
+Aurora AI - Reporte de Reglas de Asociación
+
+Estadísticas Generales:
+- Órdenes analizadas: {stats['total_orders']:,}
+- Productos únicos: {stats['unique_products']:,}
+- Promedio items por carrito: {stats['avg_basket_size']:.2f}
+- Total items vendidos: {stats['total_items_sold']:,}
+
+Top 5 Productos (por frecuencia):
+{chr(10).join([f"- {p}: {s:.1%}" for p, s in stats['top_products_support']])}
+
+Reglas Top 10:
+{chr(10).join([f"- {table.ids[i]}: Lift {table.lift[i]:.2f}, Conf {table.confidence[i]:.3f}" for i in table.top_k(10).tolist()])}
+    """
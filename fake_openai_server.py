@@ -0,0 +1,168 @@
+"""
+Servidor local compatible con la API de OpenAI (chat completions) para probar el modo LLM sin costo.
+- Responde en español citando las primeras reglas del system prompt ([Rxx]).
+- Soporta stream=true (SSE, un token por evento) con latencias configurables y keep-alive.
+- --error-rate responde 429/503 a una fracción de las llamadas para probar reintentos.
+
+Uso:
+    python fake_openai_server.py [--port 8001] [--ttft 0.4] [--token-delay 0.03] [--error-rate 0.2]
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 streamlit run chatbot.py   # cualquier API key sirve
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+_PROMPT_RULE_RE = re.compile(r"^- (R\d+): IF (.+?) => (.+?)  \(", re.MULTILINE)
+
+
+def fake_answer(messages, max_rules=2):
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    rules = _PROMPT_RULE_RE.findall(system)[:max_rules]
+    if not rules:
+        return "No hay datos disponibles en las reglas cargadas; sugiero revisar los productos más vendidos."
+    parts = [f"Si el carrito incluye {ante.split(' + ')[0]}, conviene sugerir {cons.split(' + ')[0]} [{rid}]."
+             for rid, ante, cons in rules]
+    return " ".join(parts) + " Recomiendo mostrarlo en PDP y carrito como bundle."
+
+
+def tokenize(text):
+    # word-ish pieces with their trailing space, similar in size to real BPE tokens
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeOpenAI:
+    def __init__(self, ttft=0.4, token_delay=0.03, error_rate=0.0, seed=None):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+
+    def _completion(self, request, text):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokenize(text)), "total_tokens": 0},
+        }
+
+    def _chunk(self, cid, request, delta, finish_reason=None):
+        return {
+            "id": cid,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while await self._handle_one(reader, writer):
+                pass
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_one(self, reader, writer):
+        """Serve one request on a keep-alive connection; False once the connection should close."""
+        request_line = await reader.readline()
+        if not request_line:
+            return False
+        method, path, _ = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        body = await reader.readexactly(length) if length else b""
+        self.requests += 1
+
+        if method == "GET" and path.endswith("/models"):
+            await self._json(writer, 200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+            return True
+        if method != "POST" or not path.endswith("/chat/completions"):
+            await self._json(writer, 404, {"error": {"message": f"no route for {method} {path}"}})
+            return True
+        if self.random.random() < self.error_rate:
+            # what a busy upstream looks like; the client is expected to back off and retry
+            self.errors += 1
+            status = self.random.choice((429, 503))
+            await self._json(writer, status, {"error": {"message": "fake overload", "type": "rate_limit_error"}},
+                             {"retry-after-ms": "50"})
+            return True
+        request = json.loads(body or b"{}")
+        text = fake_answer(request.get("messages", []))
+        await asyncio.sleep(self.ttft)
+        if not request.get("stream"):
+            await self._json(writer, 200, self._completion(request, text))
+            return True
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+        cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        await self._event(writer, self._chunk(cid, request, {"role": "assistant", "content": ""}))
+        for i, token in enumerate(tokenize(text)):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            await self._event(writer, self._chunk(cid, request, {"content": token}))
+        await self._event(writer, self._chunk(cid, request, {}, "stop"))
+        await self._write_chunk(writer, b"data: [DONE]\n\n")
+        await self._write_chunk(writer, b"")
+        return True
+
+    @staticmethod
+    async def _write_chunk(writer, data):
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def _event(self, writer, payload):
+        await self._write_chunk(writer, b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    @staticmethod
+    async def _json(writer, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}.get(status, "Error")
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n{extra}"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8001):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat completions server for testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.4, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions answered 429/503")
+    args = parser.parse_args(argv)
+
+    print(f"fake OpenAI API on http://{args.host}:{args.port}/v1")
+    try:
+        asyncio.run(FakeOpenAI(args.ttft, args.token_delay, args.error_rate).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
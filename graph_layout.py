@@ -0,0 +1,251 @@
+"""
+Grafo de productos para el "Mapa de Conexiones".
+- Aristas dirigidas antecedente -> consecuente, ponderadas por lift (máximo entre reglas).
+- Layout force-directed en NumPy estilo ForceAtlas2; en grafos grandes la repulsión usa una grilla
+  tipo Barnes–Hut (centroides por celda) en lugar de todos los pares.
+- Se calcula una vez por versión de reglas; filtrar (lift mínimo, top nodos, foco) solo recorta,
+  las coordenadas no cambian.
+- Render SVG vectorial con tooltips, grosor por lift y tamaño por grado.
+"""
+
+import html
+
+import numpy as np
+
+# up to this many nodes the exact O(n²) repulsion is cheap enough per iteration
+EXACT_LAYOUT_NODES = 600
+LAYOUT_ITERATIONS = 150
+LARGE_LAYOUT_ITERATIONS = 60
+NODE_CHUNK = 2048
+MAX_LABELS = 40
+
+
+class ProductGraph:
+    """Nodes are product ids (``nodes[k]``); edge ``e`` goes ``src[e] -> dst[e]`` in node positions."""
+
+    def __init__(self, nodes, src, dst, lift, confidence, rules):
+        self.nodes = nodes
+        self.src = src
+        self.dst = dst
+        self.lift = lift
+        self.confidence = confidence
+        self.rules = rules
+        self.positions = None
+
+    @classmethod
+    def from_table(cls, table):
+        # every antecedent item -> every consequent item of each rule, without a Python loop
+        a_sizes = np.diff(table.ante_offsets)
+        c_sizes = np.diff(table.cons_offsets)
+        pairs = a_sizes * c_sizes
+        rule = np.repeat(np.arange(len(table)), pairs)
+        starts = np.zeros(len(table), dtype=np.int64)
+        starts[1:] = np.cumsum(pairs)[:-1]
+        k = np.arange(int(pairs.sum())) - starts[rule]
+        src = table.ante_items[table.ante_offsets[rule] + k // c_sizes[rule]].astype(np.int64)
+        dst = table.cons_items[table.cons_offsets[rule] + k % c_sizes[rule]].astype(np.int64)
+
+        nodes, local = np.unique(np.concatenate([src, dst]), return_inverse=True)
+        src, dst = local[:len(src)], local[len(src):]
+        keys, edge = np.unique(src * len(nodes) + dst, return_inverse=True)
+        lift = np.zeros(len(keys), dtype=np.float32)
+        confidence = np.zeros(len(keys), dtype=np.float32)
+        np.maximum.at(lift, edge, table.lift[rule])
+        np.maximum.at(confidence, edge, table.confidence[rule])
+        return cls(nodes.astype(np.int32), keys // len(nodes), keys % len(nodes), lift, confidence,
+                   np.bincount(edge, minlength=len(keys)))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def degree(self):
+        return np.bincount(self.src, minlength=len(self)) + np.bincount(self.dst, minlength=len(self))
+
+    @property
+    def strength(self):
+        """Sum of the lift of the edges touching each node."""
+        return (np.bincount(self.src, self.lift, minlength=len(self))
+                + np.bincount(self.dst, self.lift, minlength=len(self)))
+
+    def layout(self, iterations=None, seed=42):
+        """Node coordinates in [0, 1]² (computed once, then reused)."""
+        if self.positions is None:
+            self.positions = force_layout(len(self), self.src, self.dst, np.log1p(self.lift),
+                                          iterations=iterations, seed=seed)
+        return self.positions
+
+    def select(self, min_lift=0.0, max_nodes=None, focus=()):
+        """``(node positions, edge positions)`` left after filtering.
+
+        ``focus`` (product ids) keeps only those products and their direct neighbours; ``max_nodes``
+        keeps the strongest nodes by summed lift.
+        """
+        edges = np.flatnonzero(self.lift >= min_lift)
+        if len(focus):
+            in_focus = np.isin(self.nodes, np.asarray(focus, dtype=self.nodes.dtype))
+            edges = edges[in_focus[self.src[edges]] | in_focus[self.dst[edges]]]
+        keep = np.zeros(len(self), dtype=bool)
+        keep[self.src[edges]] = True
+        keep[self.dst[edges]] = True
+        nodes = np.flatnonzero(keep)
+        if max_nodes is not None and len(nodes) > max_nodes:
+            strength = np.bincount(self.src[edges], self.lift[edges], minlength=len(self)) \
+                + np.bincount(self.dst[edges], self.lift[edges], minlength=len(self))
+            nodes = nodes[np.argsort(-strength[nodes], kind="stable")[:max_nodes]]
+            keep[:] = False
+            keep[nodes] = True
+            edges = edges[keep[self.src[edges]] & keep[self.dst[edges]]]
+        return np.sort(nodes), edges
+
+
+def _exact_repulsion(pos, mass):
+    # sum_j m_j (p_i - p_j) / d_ij² as two matrix products, without an (n, n, 2) temporary
+    x, y = pos[:, 0], pos[:, 1]
+    d2 = (x[:, None] - x[None, :]) ** 2 + (y[:, None] - y[None, :]) ** 2 + 1e-9
+    np.fill_diagonal(d2, np.inf)
+    w = mass[None, :] / d2
+    return mass[:, None] * (pos * w.sum(axis=1)[:, None] - w @ pos)
+
+
+def _grid_repulsion(pos, mass, cells):
+    # Barnes–Hut on a fixed grid: each node is pushed by the mass centroid of every cell; its own
+    # cell's centroid excludes the node itself
+    lo = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lo, 1e-9)
+    cx, cy = (np.minimum(((pos - lo) / span * cells).astype(np.int64), cells - 1)).T
+    cell = cx * cells + cy
+    cell_mass = np.bincount(cell, mass, minlength=cells * cells)
+    occupied = np.flatnonzero(cell_mass)
+    weighted = np.stack([np.bincount(cell, mass * pos[:, d], minlength=cells * cells) for d in (0, 1)], axis=1)
+    centroid = weighted[occupied] / cell_mass[occupied, None]
+    column = np.full(cells * cells, -1)
+    column[occupied] = np.arange(len(occupied))
+
+    force = np.zeros_like(pos)
+    for start in range(0, len(pos), NODE_CHUNK):
+        rows = slice(start, start + NODE_CHUNK)
+        p, m, own = pos[rows], mass[rows], cell[rows]
+        d2 = (p[:, 0:1] - centroid[None, :, 0]) ** 2 + (p[:, 1:2] - centroid[None, :, 1]) ** 2 + 1e-9
+        w = cell_mass[occupied][None, :] / d2
+        w[np.arange(len(p)), column[own]] = 0.0
+        f = p * w.sum(axis=1)[:, None] - w @ centroid
+        # own cell without the node itself
+        rest = cell_mass[own] - m
+        has_rest = rest > 1e-9
+        c_rest = (weighted[own] - m[:, None] * p) / np.where(has_rest, rest, 1.0)[:, None]
+        d = p - c_rest
+        f += np.where(has_rest, rest / ((d ** 2).sum(axis=1) + 1e-9), 0.0)[:, None] * d
+        force[rows] = m[:, None] * f
+    return force
+
+
+def force_layout(n, src, dst, weight, iterations=None, seed=42, gravity=0.05):
+    """Fruchterman–Reingold forces with ForceAtlas2's degree-scaled repulsion (hubs push harder) and a
+    weak pull towards the centre so disconnected bundles stay on screen. Returns ``(n, 2)`` in [0, 1].
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+    if n == 1:
+        return np.full((1, 2), 0.5)
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(0.0, 1.0, size=(n, 2))
+    large = n > EXACT_LAYOUT_NODES
+    if iterations is None:
+        iterations = LARGE_LAYOUT_ITERATIONS if large else LAYOUT_ITERATIONS
+    degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    mass = 1.0 + np.log1p(degree)
+    weight = np.asarray(weight, dtype=np.float64)
+    k2 = 1.0 / n  # squared ideal edge length for the unit square
+    cells = int(np.clip(np.sqrt(n) / 3, 8, 24))
+
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        force = k2 * (_grid_repulsion(pos, mass, cells) if large else _exact_repulsion(pos, mass))
+        delta = pos[src] - pos[dst]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) * weight / np.sqrt(k2))[:, None]
+        np.add.at(force, src, -pull)
+        np.add.at(force, dst, pull)
+        force -= gravity * mass[:, None] * (pos - pos.mean(axis=0))
+        # each node moves at most ``temperature``; cooling freezes the layout
+        norm = np.sqrt((force ** 2).sum(axis=1)) + 1e-12
+        pos += force * (np.minimum(norm, temperature) / norm)[:, None]
+        temperature -= cooling
+
+    lo, hi = pos.min(axis=0), pos.max(axis=0)
+    return (pos - lo) / np.maximum(hi - lo, 1e-9)
+
+
+def to_svg(graph, labels, nodes, edges, width=960, height=600, title="Red de Productos Relacionados",
+           max_labels=MAX_LABELS):
+    """SVG of the selected ``nodes``/``edges`` (as returned by ``ProductGraph.select``)."""
+    pos = graph.layout()
+    pad = 40
+    xy = np.empty((len(graph), 2))
+    xy[:, 0] = pad + pos[:, 0] * (width - 2 * pad)
+    xy[:, 1] = pad + 20 + pos[:, 1] * (height - 2 * pad - 20)
+    degree = np.bincount(graph.src[edges], minlength=len(graph)) + np.bincount(graph.dst[edges], minlength=len(graph))
+    radius = 4.0 + 10.0 * np.sqrt(degree / max(1, degree.max(initial=0)))
+    lift = graph.lift[edges]
+    lo, hi = (float(lift.min()), float(lift.max())) if len(edges) else (0.0, 1.0)
+    stroke = 0.6 + 3.4 * (lift - lo) / max(hi - lo, 1e-9)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="100%" '
+        f'style="background:white;font-family:sans-serif">',
+        '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="6" markerHeight="6" '
+        'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="#7fb8d6"/></marker></defs>',
+        f'<text x="{width / 2}" y="28" text-anchor="middle" font-size="18" font-weight="bold">{html.escape(title)}</text>',
+        '<g class="edges">',
+    ]
+    for e, w in zip(edges.tolist(), stroke.tolist()):
+        s, d = int(graph.src[e]), int(graph.dst[e])
+        (x1, y1), (x2, y2) = xy[s], xy[d]
+        length = max(np.hypot(x2 - x1, y2 - y1), 1e-9)
+        # stop the arrow at the target's circle
+        x2 -= (x2 - x1) / length * radius[d]
+        y2 -= (y2 - y1) / length * radius[d]
+        tip = (f"{labels[graph.nodes[s]]} → {labels[graph.nodes[d]]} · lift {graph.lift[e]:.2f} · "
+               f"conf {graph.confidence[e]:.2f} · {graph.rules[e]} regla(s)")
+        parts.append(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" stroke="#a8d8ea" '
+                     f'stroke-opacity="0.8" stroke-width="{w:.2f}" marker-end="url(#arrow)">'
+                     f'<title>{html.escape(tip)}</title></line>')
+    parts.append('</g><g class="nodes">')
+    for k in nodes.tolist():
+        label = labels[graph.nodes[k]]
+        parts.append(f'<circle cx="{xy[k, 0]:.1f}" cy="{xy[k, 1]:.1f}" r="{radius[k]:.1f}" fill="#667eea" '
+                     f'fill-opacity="0.85"><title>{html.escape(label)} · {degree[k]} conexiones</title></circle>')
+    # labels only for the best connected nodes; the rest show on hover
+    for k in nodes[np.argsort(-degree[nodes], kind="stable")[:max_labels]].tolist():
+        parts.append(f'<text x="{xy[k, 0]:.1f}" y="{xy[k, 1] - radius[k] - 3:.1f}" text-anchor="middle" '
+                     f'font-size="10" fill="#333">{html.escape(labels[graph.nodes[k]])}</text>')
+    parts.append("</g></svg>")
+    return "".join(parts)
+
+
+def to_html(svg):
+    """Wrap an SVG with wheel zoom and drag to pan (for ``streamlit.components.v1.html``)."""
+    return """
+<div id="graph" style="width:100%;overflow:hidden;cursor:grab">""" + svg + """</div>
+<script>
+const svg = document.querySelector("#graph svg");
+let [x, y, w, h] = svg.getAttribute("viewBox").split(" ").map(Number);
+const set = () => svg.setAttribute("viewBox", `${x} ${y} ${w} ${h}`);
+svg.addEventListener("wheel", (ev) => {
+  ev.preventDefault();
+  const r = svg.getBoundingClientRect(), s = ev.deltaY > 0 ? 1.15 : 1 / 1.15;
+  const px = x + (ev.clientX - r.left) / r.width * w, py = y + (ev.clientY - r.top) / r.height * h;
+  x = px - (px - x) * s; y = py - (py - y) * s; w *= s; h *= s; set();
+});
+let drag = null;
+svg.addEventListener("mousedown", (ev) => { drag = [ev.clientX, ev.clientY]; });
+window.addEventListener("mouseup", () => { drag = null; });
+window.addEventListener("mousemove", (ev) => {
+  if (!drag) return;
+  const r = svg.getBoundingClientRect();
+  x -= (ev.clientX - drag[0]) / r.width * w; y -= (ev.clientY - drag[1]) / r.height * h;
+  drag = [ev.clientX, ev.clientY]; set();
+});
+</script>
+"""
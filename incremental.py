@@ -0,0 +1,234 @@
+"""
+Mantenimiento incremental de reglas cuando llegan órdenes nuevas.
+- Guarda conteos por itemset (itemsets frecuentes y un margen debajo del umbral).
+- Cada lote nuevo solo se escanea a sí mismo: actualiza conteos, soporte/confianza/lift
+  y reporta reglas que suben o bajan de los umbrales.
+- STATS se actualiza con acumuladores, sin recalcular sobre el histórico.
+
+Uso:
+    python incremental.py state.npz new_orders.csv [--init] [--out rules.json] [--snapshot rules.snap]
+"""
+
+import json
+import math
+
+import numpy as np
+
+from miner import (
+    StatsAccumulator,
+    _count_extensions,
+    build_basket_matrix,
+    frequent_itemsets,
+    generate_rules,
+    score_rules,
+)
+from products import ProductDictionary
+
+
+class UpdateReport:
+    def __init__(self, new_orders, promoted, demoted, untracked):
+        self.new_orders = new_orders
+        # (antecedent ids, consequent ids) pairs that crossed the rule thresholds
+        self.promoted = promoted
+        self.demoted = demoted
+        # itemsets first seen frequent in this batch; their stored count only covers new baskets
+        self.untracked = untracked
+
+    def __repr__(self):
+        return (f"UpdateReport(new_orders={self.new_orders}, promoted={len(self.promoted)}, "
+                f"demoted={len(self.demoted)}, untracked={self.untracked})")
+
+
+class IncrementalMiner:
+    """Itemset count store that is kept current from new baskets only.
+
+    Itemsets are tracked down to ``min_support * watch_ratio`` so rules can be promoted when their
+    support grows past ``min_support``. An itemset below the watch margin in every earlier batch is
+    only picked up once it is frequent inside a new batch, with a count that is a lower bound; such
+    itemsets are listed in ``lower_bound`` until the next full re-mine (``fit``).
+    """
+
+    def __init__(self, min_support=0.01, min_confidence=0.2, min_lift=1.0, max_len=4, watch_ratio=0.5,
+                 products=None):
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.min_lift = min_lift
+        self.max_len = max_len
+        self.watch_ratio = watch_ratio
+        self.products = ProductDictionary() if products is None else products
+        self.stats = StatsAccumulator(self.products)
+        self.counts = {}
+        self.lower_bound = set()
+
+    @property
+    def n_baskets(self):
+        return self.stats.n_orders
+
+    def _watch_support(self):
+        return self.min_support * self.watch_ratio
+
+    def fit(self, baskets):
+        """Full mine over ``baskets``; resets the count store."""
+        matrix = build_basket_matrix(baskets, products=self.products)
+        self.stats = StatsAccumulator(self.products).add_matrix(matrix)
+        self.counts = {k: v for k, v in frequent_itemsets(matrix, self._watch_support(), self.max_len).items()
+                       if len(k) > 1}
+        self.lower_bound = set()
+        return self
+
+    def _rule_keys(self):
+        return {(a, c) for a, c, *_ in score_rules(self.frequent(), self.n_baskets, self.min_confidence, self.min_lift)}
+
+    def update(self, baskets):
+        before = self._rule_keys()
+        matrix = build_basket_matrix(baskets, products=self.products)
+        if not matrix.n_baskets:
+            return UpdateReport(0, [], [], 0)
+
+        # 1) tracked itemsets: add their occurrences in the new baskets, grouped by shared prefix
+        by_prefix = {}
+        for itemset in self.counts:
+            by_prefix.setdefault(itemset[:-1], []).append(itemset[-1])
+        for prefix, tails in by_prefix.items():
+            tails = np.asarray(tails, dtype=np.int64)
+            for tail, count in zip(tails.tolist(), _count_extensions(matrix.bits, prefix, tails).tolist()):
+                self.counts[prefix + (tail,)] += count
+
+        # 2) itemsets frequent inside the batch but not tracked yet
+        untracked = 0
+        for itemset, count in frequent_itemsets(matrix, self._watch_support(), self.max_len).items():
+            if len(itemset) > 1 and itemset not in self.counts:
+                self.counts[itemset] = count
+                self.lower_bound.add(itemset)
+                untracked += 1
+
+        # 3) singletons and STATS come from the exact running totals
+        self.stats.add_matrix(matrix)
+
+        # 4) drop itemsets that fell below the watch margin
+        floor = math.ceil(self._watch_support() * self.n_baskets)
+        for itemset in [k for k, v in self.counts.items() if v < floor]:
+            del self.counts[itemset]
+            self.lower_bound.discard(itemset)
+
+        after = self._rule_keys()
+        return UpdateReport(matrix.n_baskets, sorted(after - before), sorted(before - after), untracked)
+
+    def frequent(self):
+        """``{itemset: count}`` for every itemset at or above ``min_support`` (singletons included)."""
+        min_count = max(1, math.ceil(self.min_support * self.n_baskets))
+        counts = self.stats.item_counts
+        frequent = {(int(i),): int(counts[i]) for i in np.flatnonzero(counts >= min_count)}
+        frequent.update((k, v) for k, v in self.counts.items() if v >= min_count)
+        return frequent
+
+    def rules(self):
+        """RULES dicts; a rule resting on a ``lower_bound`` count is marked ``"lower_bound": True``."""
+        rules = generate_rules(self.frequent(), self.n_baskets, self.products, self.min_confidence, self.min_lift)
+        if self.lower_bound:
+            encode = self.products.encode
+            for rule in rules:
+                antecedent = tuple(sorted(encode(rule["antecedent"]).tolist()))
+                consequent = tuple(sorted(encode(rule["consequent"]).tolist()))
+                if not self.lower_bound.isdisjoint((antecedent, consequent, tuple(sorted(antecedent + consequent)))):
+                    rule["lower_bound"] = True
+        return rules
+
+    def stats_dict(self, top_n=5):
+        return self.stats.to_stats(top_n)
+
+    def save(self, path):
+        keys = list(self.counts)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(k) for k in keys])
+        config = {
+            "min_support": self.min_support, "min_confidence": self.min_confidence, "min_lift": self.min_lift,
+            "max_len": self.max_len, "watch_ratio": self.watch_ratio,
+            "n_orders": self.stats.n_orders, "total_items": self.stats.total_items,
+        }
+        with open(path, "wb") as fh:
+            np.savez(
+                fh,
+                config=np.array(json.dumps(config)),
+                labels=np.array(self.products.labels, dtype=str),
+                item_counts=self.stats.item_counts,
+                itemset_offsets=offsets,
+                itemset_items=np.fromiter((i for k in keys for i in k), dtype=np.int32, count=int(offsets[-1])),
+                itemset_counts=np.fromiter((self.counts[k] for k in keys), dtype=np.int64, count=len(keys)),
+                lower_bound=np.fromiter((k in self.lower_bound for k in keys), dtype=bool, count=len(keys)),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            config = json.loads(str(data["config"]))
+            miner = cls(config["min_support"], config["min_confidence"], config["min_lift"], config["max_len"],
+                        config["watch_ratio"], ProductDictionary(data["labels"].tolist()))
+            miner.stats.add_counts(data["item_counts"], config["n_orders"], config["total_items"])
+            offsets, items = data["itemset_offsets"].tolist(), data["itemset_items"].tolist()
+            counts, lower = data["itemset_counts"].tolist(), data["lower_bound"].tolist()
+        for i, count in enumerate(counts):
+            key = tuple(items[offsets[i]:offsets[i + 1]])
+            miner.counts[key] = count
+            if lower[i]:
+                miner.lower_bound.add(key)
+        return miner
+
+
+def main(argv=None):
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Update mined rules with a new batch of orders.")
+    parser.add_argument("state")
+    parser.add_argument("orders")
+    parser.add_argument("--order-col", default="order_id")
+    parser.add_argument("--product-col", default="product")
+    parser.add_argument("--init", action="store_true", help="full mine of ORDERS into a new state file")
+    parser.add_argument("--min-support", type=float, default=0.01)
+    parser.add_argument("--min-confidence", type=float, default=0.2)
+    parser.add_argument("--out", help="write RULES/STATS as JSON")
+    parser.add_argument("--snapshot", help="write a binary rules snapshot of the exact-count rules (see snapshot.py)")
+    parser.add_argument("--allow-split-orders", action="store_true",
+                        help="keep the counts even if an export not grouped by order had orders split")
+    args = parser.parse_args(argv)
+
+    from ingest import IngestReport, SplitOrdersError, check_split_orders, iter_basket_batches, iter_baskets, iter_lines
+
+    report = IngestReport()
+    if args.init or not os.path.exists(args.state):
+        baskets = iter_baskets(iter_lines(args.orders, args.order_col, args.product_col), report)
+        miner = IncrementalMiner(args.min_support, args.min_confidence).fit(baskets)
+        print(f"initialized from {miner.n_baskets} orders, {len(miner.counts)} tracked itemsets")
+    else:
+        miner = IncrementalMiner.load(args.state)
+        for batch in iter_basket_batches(args.orders, order_col=args.order_col, product_col=args.product_col,
+                                         report=report):
+            print(miner.update(batch))
+    print(report.tick())
+    if not args.allow_split_orders:
+        # refuse before saving: skewed counts would carry into every later update
+        try:
+            check_split_orders(report, args.order_col)
+        except SplitOrdersError as exc:
+            parser.error(f"{exc}; {args.state} was not changed (or pass --allow-split-orders)")
+    miner.save(args.state)
+
+    rules, stats = miner.rules(), miner.stats_dict()
+    provisional = sum(1 for rule in rules if rule.get("lower_bound"))
+    if provisional:
+        print(f"{provisional} rules rest on lower-bound counts (marked in --out, left out of --snapshot "
+              f"until the next --init)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"rules": rules, "stats": stats}, fh, ensure_ascii=False, indent=2)
+    if args.snapshot:
+        from rule_store import RuleTable
+        from snapshot import write_snapshot
+
+        rules = [rule for rule in rules if not rule.get("lower_bound")]
+        write_snapshot(args.snapshot, RuleTable.from_rules(rules, ProductDictionary.from_rules(rules, stats)), stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Ingesta en streaming de exports de líneas de orden (CSV o Parquet).
+- Lee el archivo por bloques y agrupa líneas en canastas sin cargarlo completo en memoria.
+- Alimenta el minero (matriz bit-packed) y los acumuladores de STATS.
+- Reporta filas/seg y RSS pico.
+
+Uso:
+    python ingest.py orders.csv --order-col order_id --product-col product [--out rules.json] [--snapshot rules.snap]
+"""
+
+import csv
+import sys
+import time
+from collections import OrderedDict, deque
+
+from itemsets import ClosedItemsets
+from miner import BasketMatrixBuilder, compute_stats, frequent_itemsets, generate_rules
+
+CSV_CHUNK_ROWS = 100_000
+PARQUET_BATCH_ROWS = 256_000
+# orders kept open while grouping; exports sorted/clustered by order need only a handful
+MAX_OPEN_ORDERS = 10_000
+PROGRESS_EVERY_ROWS = 1_000_000
+
+
+class SplitOrdersError(ValueError):
+    pass
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class IngestReport:
+    def __init__(self):
+        self.rows = 0
+        self.baskets = 0
+        # orders whose lines were not contiguous enough and got split into several baskets
+        self.split_orders = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.peak_rss_mb = None
+
+    def tick(self):
+        self.seconds = time.perf_counter() - self.started
+        self.peak_rss_mb = peak_rss_mb()
+        return self
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "baskets": self.baskets,
+            "split_orders": self.split_orders,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "peak_rss_mb": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+        }
+
+    def __str__(self):
+        rss = "n/a" if self.peak_rss_mb is None else f"{self.peak_rss_mb:,.0f} MB"
+        return (f"{self.rows:,} rows -> {self.baskets:,} baskets in {self.seconds:,.1f}s "
+                f"({self.rows_per_sec:,.0f} rows/s, peak RSS {rss})")
+
+
+def iter_csv_lines(path, order_col="order_id", product_col="product", chunk_rows=CSV_CHUNK_ROWS):
+    """Yield lists of ``(order_id, product)`` tuples, ``chunk_rows`` at a time."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        header = next(reader)
+        o, p = header.index(order_col), header.index(product_col)
+        chunk = []
+        for row in reader:
+            chunk.append((row[o], row[p]))
+            if len(chunk) == chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_parquet_lines(path, order_col="order_id", product_col="product", batch_rows=PARQUET_BATCH_ROWS):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("Parquet ingestion requires pyarrow (pip install pyarrow)") from exc
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=batch_rows, columns=[order_col, product_col]):
+        orders = batch.column(0).to_pylist()
+        products = batch.column(1).to_pylist()
+        yield list(zip(orders, products))
+
+
+def iter_lines(path, order_col="order_id", product_col="product"):
+    if str(path).endswith((".parquet", ".pq")):
+        return iter_parquet_lines(path, order_col, product_col)
+    return iter_csv_lines(path, order_col, product_col)
+
+
+def iter_baskets(chunks, report=None, max_open_orders=MAX_OPEN_ORDERS, progress=None, with_ids=False):
+    """Group streamed order lines into baskets (``(order_id, basket)`` pairs with ``with_ids``).
+
+    Only ``max_open_orders`` orders are buffered: when more are open, the least recently seen one is
+    emitted. An order whose lines show up again after it was emitted becomes a second basket; this
+    is counted in ``report.split_orders`` when it happens within a bounded window of recent orders.
+    """
+    report = report or IngestReport()
+    open_orders = OrderedDict()
+    closed = set()
+    closed_window = deque()
+    window = 4 * max_open_orders
+    next_progress = PROGRESS_EVERY_ROWS
+    for chunk in chunks:
+        for order_id, product in chunk:
+            basket = open_orders.get(order_id)
+            if basket is None:
+                if order_id in closed:
+                    report.split_orders += 1
+                basket = open_orders[order_id] = []
+                if len(open_orders) > max_open_orders:
+                    oldest, items = open_orders.popitem(last=False)
+                    closed.add(oldest)
+                    closed_window.append(oldest)
+                    if len(closed_window) > window:
+                        closed.discard(closed_window.popleft())
+                    report.baskets += 1
+                    yield (oldest, items) if with_ids else items
+            else:
+                open_orders.move_to_end(order_id)
+            basket.append(product)
+        report.rows += len(chunk)
+        if progress and report.rows >= next_progress:
+            progress(report.tick())
+            next_progress += PROGRESS_EVERY_ROWS
+    for order_id, items in open_orders.items():
+        report.baskets += 1
+        yield (order_id, items) if with_ids else items
+    report.tick()
+
+
+def ingest_file(path, order_col="order_id", product_col="product", products=None, progress=None,
+                max_open_orders=MAX_OPEN_ORDERS, shared=False):
+    """Stream ``path`` into a bit-packed basket matrix; returns ``(BasketMatrix, IngestReport)``.
+
+    ``shared`` builds the matrix in shared memory for parallel counting (release it with ``matrix.close()``).
+    """
+    report = IngestReport()
+    builder = BasketMatrixBuilder(products=products)
+    builder.add_many(iter_baskets(iter_lines(path, order_col, product_col), report, max_open_orders, progress))
+    matrix = builder.finish(shared)
+    report.tick()
+    return matrix, report
+
+
+def iter_basket_batches(path, batch_baskets=100_000, order_col="order_id", product_col="product", report=None):
+    """Baskets in lists of ``batch_baskets`` (e.g. to feed IncrementalMiner.update)."""
+    batch = []
+    for basket in iter_baskets(iter_lines(path, order_col, product_col), report):
+        batch.append(basket)
+        if len(batch) == batch_baskets:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def check_split_orders(report, order_col="order_id"):
+    """Raise SplitOrdersError if grouping split orders into several baskets (every support would be skewed)."""
+    if report.split_orders:
+        raise SplitOrdersError(f"{report.split_orders:,} orders were split into several baskets: the export is not "
+                               f"grouped by {order_col!r}; sort it by that column or raise the open-order limit")
+
+
+def mine_file(path, order_col="order_id", product_col="product", min_support=0.01, min_confidence=0.2,
+              min_lift=1.0, max_len=4, progress=None, n_jobs=1, max_open_orders=MAX_OPEN_ORDERS,
+              allow_split_orders=False):
+    """Mine ``(RULES, STATS, IngestReport)`` from an order-line export without loading it whole.
+
+    Raises SplitOrdersError before mining when orders were split, unless ``allow_split_orders``.
+    """
+    matrix, report = ingest_file(path, order_col, product_col, progress=progress, max_open_orders=max_open_orders,
+                                 shared=n_jobs != 1)
+    try:
+        if not allow_split_orders:
+            check_split_orders(report, order_col)
+        itemsets = frequent_itemsets(matrix, min_support, max_len, n_jobs)
+        rules = generate_rules(itemsets, matrix.n_baskets, matrix.products, min_confidence, min_lift)
+        stats = compute_stats(matrix)
+    finally:
+        matrix.close()
+    report.tick()
+    return rules, stats, report
+
+
+def mine_file_closed(path, order_col="order_id", product_col="product", min_support=0.01, min_confidence=0.2,
+                     min_lift=1.0, max_len=4, progress=None, n_jobs=1, max_open_orders=MAX_OPEN_ORDERS,
+                     allow_split_orders=False):
+    """Like ``mine_file`` but keeps closed itemsets: ``(ClosedItemsets, STATS, IngestReport)``."""
+    matrix, report = ingest_file(path, order_col, product_col, progress=progress, max_open_orders=max_open_orders,
+                                 shared=n_jobs != 1)
+    try:
+        if not allow_split_orders:
+            check_split_orders(report, order_col)
+        frequent = frequent_itemsets(matrix, min_support, max_len, n_jobs)
+        closed = ClosedItemsets.from_frequent(frequent, matrix.n_baskets, matrix.products, min_confidence, min_lift)
+        stats = compute_stats(matrix)
+    finally:
+        matrix.close()
+    report.tick()
+    return closed, stats, report
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Stream an order-line export (CSV/Parquet) into rules and stats.")
+    parser.add_argument("orders")
+    parser.add_argument("--order-col", default="order_id")
+    parser.add_argument("--product-col", default="product")
+    parser.add_argument("--min-support", type=float, default=0.01)
+    parser.add_argument("--min-confidence", type=float, default=0.2)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--max-len", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=1, help="support-counting processes (0 = all cores)")
+    parser.add_argument("--max-open-orders", type=int, default=MAX_OPEN_ORDERS,
+                        help="orders buffered while grouping lines (raise it for exports not sorted by order)")
+    parser.add_argument("--allow-split-orders", action="store_true",
+                        help="mine even if some orders were split into several baskets")
+    parser.add_argument("--out", help="write RULES/STATS as JSON")
+    parser.add_argument("--snapshot", help="write a binary rules snapshot (see snapshot.py)")
+    args = parser.parse_args(argv)
+
+    try:
+        rules, stats, report = mine_file(
+            args.orders, args.order_col, args.product_col, args.min_support, args.min_confidence,
+            args.min_lift, args.max_len, progress=lambda r: print(f"  {r}", file=sys.stderr), n_jobs=args.jobs,
+            max_open_orders=args.max_open_orders, allow_split_orders=args.allow_split_orders,
+        )
+    except SplitOrdersError as exc:
+        parser.error(f"{exc} (--max-open-orders), or pass --allow-split-orders")
+    print(report)
+    print(f"{len(rules)} rules from {stats['total_orders']} orders")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"rules": rules, "stats": stats, "ingest": report.as_dict()}, fh, ensure_ascii=False, indent=2)
+    if args.snapshot:
+        from products import ProductDictionary
+        from rule_store import RuleTable
+        from snapshot import write_snapshot
+
+        write_snapshot(args.snapshot, RuleTable.from_rules(rules, ProductDictionary.from_rules(rules, stats)), stats)
+
+
+if __name__ == "__main__":
+    main()
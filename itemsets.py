@@ -0,0 +1,251 @@
+"""
+Modo de itemsets frecuentes cerrados: almacenamiento compacto y reglas derivadas al consultar.
+- Solo se guardan los itemsets cerrados (ningún superconjunto tiene el mismo soporte) con su conteo.
+- Es una compresión sin pérdida: el soporte de cualquier itemset frecuente es el mayor conteo
+  entre los cerrados que lo contienen, así que confidence/lift salen exactos.
+- Las reglas se derivan por canasta (solo las que tocan sus productos); la tabla completa
+  se arma únicamente si algún consumidor la pide (prompt completo, grafo, tabla de reglas).
+
+Uso:
+    python miner.py orders.csv --closed --snapshot closed.snap
+"""
+
+import hashlib
+from itertools import combinations
+
+import numpy as np
+
+from miner import build_basket_matrix, compute_stats, frequent_itemsets, score_rules
+from products import ProductDictionary
+from rule_store import METRICS, RuleTable
+
+
+def closed_itemsets(frequent):
+    """Closed subset of a ``frequent_itemsets`` result: drop X when some X + {e} has the same count."""
+    not_closed = set()
+    for itemset, count in frequent.items():
+        if len(itemset) < 2:
+            continue
+        for j in range(len(itemset)):
+            subset = itemset[:j] + itemset[j + 1:]
+            if frequent[subset] == count:
+                not_closed.add(subset)
+    return {itemset: count for itemset, count in frequent.items() if itemset not in not_closed}
+
+
+def rule_id(labels, antecedent, consequent):
+    """Stable id of a derived rule: the same products give the same id in every query and snapshot."""
+    key = "\x1f".join(labels[i] for i in antecedent) + "\x1e" + "\x1f".join(labels[i] for i in consequent)
+    return f"R{int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=6).digest(), 'big')}"
+
+
+def _csr(groups):
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(g) for g in groups])
+    items = np.fromiter((i for g in groups for i in g), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, items
+
+
+class ClosedItemsets:
+    """Closed itemset ``i`` is ``items[offsets[i]:offsets[i + 1]]`` (sorted ids) found in ``counts[i]`` orders."""
+
+    # arrays persisted by snapshot.write_itemset_snapshot
+    ARRAYS = ("offsets", "items", "counts", "posting_sets", "posting_bounds")
+
+    def __init__(self, products, offsets, items, counts, n_baskets, min_confidence=0.2, min_lift=1.0,
+                 n_rules=0, posting_sets=None, posting_bounds=None):
+        self.products = products
+        self.offsets = offsets
+        self.items = items
+        self.counts = counts
+        self.n_baskets = n_baskets
+        self.min_confidence = min_confidence
+        self.min_lift = min_lift
+        self.n_rules = n_rules
+        if posting_sets is None:
+            # postings: closed itemset positions (ascending) grouped by product id
+            set_of_item = np.repeat(np.arange(len(counts)), np.diff(offsets))
+            by_item = np.argsort(items, kind="stable")
+            posting_sets = set_of_item[by_item]
+            posting_bounds = np.searchsorted(items[by_item], np.arange(len(products) + 1))
+        self.posting_sets = posting_sets
+        self.posting_bounds = posting_bounds
+        self._item_counts = None
+        self._members = None
+
+    @classmethod
+    def from_frequent(cls, frequent, n_baskets, products, min_confidence=0.2, min_lift=1.0):
+        closed = closed_itemsets(frequent)
+        itemsets = sorted(closed)
+        offsets, items = _csr(itemsets)
+        counts = np.fromiter((closed[s] for s in itemsets), dtype=np.int64, count=len(itemsets))
+        n_rules = len(score_rules(frequent, n_baskets, min_confidence, min_lift))
+        return cls(products, offsets, items, counts, n_baskets, min_confidence, min_lift, n_rules)
+
+    @classmethod
+    def from_json(cls, data):
+        """Inverse of ``to_json`` (``data`` may also carry STATS, as miner.py --closed writes it)."""
+        products = ProductDictionary()
+        groups = [sorted(products.add(label) for label in entry["items"]) for entry in data["closed_itemsets"]]
+        for label, _ in data.get("stats", {}).get("top_products_support", ()):
+            products.add(label)
+        offsets, items = _csr(groups)
+        counts = np.fromiter((entry["count"] for entry in data["closed_itemsets"]), dtype=np.int64,
+                             count=len(groups))
+        return cls(products, offsets, items, counts, data["n_baskets"], data["min_confidence"], data["min_lift"],
+                   data["n_rules"])
+
+    def to_json(self):
+        return {
+            "closed_itemsets": [{"items": self.products.decode(self.itemset(i)), "count": int(self.counts[i])}
+                                for i in range(len(self))],
+            "n_baskets": self.n_baskets,
+            "min_confidence": self.min_confidence,
+            "min_lift": self.min_lift,
+            "n_rules": self.n_rules,
+        }
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def itemset(self, i):
+        return tuple(self.items[self.offsets[i]:self.offsets[i + 1]].tolist())
+
+    def postings(self, item):
+        if not 0 <= item < len(self.posting_bounds) - 1:
+            return self.posting_sets[:0]
+        return self.posting_sets[self.posting_bounds[item]:self.posting_bounds[item + 1]]
+
+    @property
+    def item_counts(self):
+        # single-product counts: the largest count among the closed itemsets holding the product
+        if self._item_counts is None:
+            item_counts = np.zeros(len(self.posting_bounds) - 1, dtype=np.int64)
+            np.maximum.at(item_counts, self.items, np.repeat(self.counts, np.diff(self.offsets)))
+            self._item_counts = item_counts
+        return self._item_counts
+
+    @property
+    def members(self):
+        # (closed itemsets, longest itemset) matrix of product ids padded with -1, for containment tests
+        if self._members is None:
+            sizes = np.diff(self.offsets)
+            members = np.full((len(self), int(sizes.max(initial=0))), -1, dtype=np.int32)
+            members[np.repeat(np.arange(len(self)), sizes), np.arange(len(self.items)) - np.repeat(self.offsets[:-1], sizes)] = self.items
+            self._members = members
+        return self._members
+
+    def count(self, items):
+        """Orders containing every product id in ``items`` (0 if that itemset is not frequent)."""
+        items = list(items)
+        if not items:
+            return self.n_baskets
+        if len(items) == 1:
+            item = items[0]
+            return int(self.item_counts[item]) if 0 <= item < len(self.item_counts) else 0
+        # scan the closed itemsets of the rarest product for those holding the others too
+        items.sort(key=lambda item: len(self.postings(item)))
+        sets = self.postings(items[0])
+        held = self.members[sets]
+        mask = np.ones(len(sets), dtype=bool)
+        for item in items[1:]:
+            mask &= (held == item).any(axis=1)
+        return int(self.counts[sets[mask]].max(initial=0))
+
+    def _expand(self, sets, touching=None):
+        """Frequent itemsets inside the closed itemsets ``sets`` (only those sharing an id with
+        ``touching`` when given) with the largest count among ``sets``."""
+        counts = {}
+        for i in sets:
+            count = int(self.counts[i])
+            members = self.itemset(i)
+            for size in range(1, len(members) + 1):
+                for subset in combinations(members, size):
+                    if touching is not None and touching.isdisjoint(subset):
+                        continue
+                    if counts.get(subset, 0) < count:
+                        counts[subset] = count
+        return counts
+
+    def _table(self, found):
+        labels = self.products.labels
+        ids = [rule_id(labels, antecedent, consequent) for antecedent, consequent, *_ in found]
+        ante_offsets, ante_items = _csr([r[0] for r in found])
+        cons_offsets, cons_items = _csr([r[1] for r in found])
+        metrics = {m: np.fromiter((r[k] for r in found), dtype=np.float32, count=len(found))
+                   for k, m in enumerate(METRICS, start=2)}
+        return RuleTable(np.array(ids, dtype=str), self.products, ante_offsets, ante_items,
+                         cons_offsets, cons_items, **metrics)
+
+    def _confident(self, sets, basket):
+        """Mask of the closed itemsets C that can still yield a rule A => Y with A inside ``basket``.
+
+        Such a rule has A ⊆ C ∩ basket, so count(A) >= count(C ∩ basket) and its itemset counts
+        count(C) at most when C supplies it; below min_confidence * count(C ∩ basket) C adds nothing.
+        """
+        held = self.members[sets]
+        inside = np.isin(held, np.fromiter(basket, dtype=np.int32, count=len(basket)))
+        common = {}
+        bound = np.empty(len(sets), dtype=np.int64)
+        for k, row in enumerate(held.tolist()):
+            key = tuple(item for item, hit in zip(row, inside[k].tolist()) if hit)
+            if key not in common:
+                common[key] = self.count(key)
+            bound[k] = common[key]
+        return self.counts[sets] >= self.min_confidence * (1 - 1e-9) * bound
+
+    def basket_rules(self, items, partial=True):
+        """RuleTable of the rules whose antecedent shares a product with ``items`` (lies inside
+        ``items`` when ``partial`` is false), strongest first.
+
+        Closed itemsets holding a basket product contain every frequent itemset that touches the basket,
+        so their subsets carry exact counts; consequents outside the basket are looked up with ``count``.
+        """
+        basket = set(int(i) for i in items)
+        within = None if partial else basket
+        hits = [self.postings(i) for i in basket]
+        sets = np.unique(np.concatenate(hits)) if hits else self.posting_sets[:0]
+        # pruned sets may have supplied the count of a consequent, so consequents are looked up globally then
+        exact = set()
+        if not partial and len(sets):
+            sets = sets[self._confident(sets, basket)]
+        else:
+            exact = None
+        counts = self._expand(sets.tolist(), basket)
+        min_count = self.min_confidence * (1 - 1e-9)
+        for itemset in [s for s in counts if len(s) > 1]:
+            count = counts[itemset]
+            for size in range(1, len(itemset)):
+                for antecedent in combinations(itemset, size):
+                    if basket.isdisjoint(antecedent) or (within is not None and not within.issuperset(antecedent)):
+                        continue
+                    # the confidence test needs no lookup; only the lift of survivors needs the consequent
+                    if count < min_count * counts[antecedent]:
+                        continue
+                    consequent = tuple(i for i in itemset if i not in antecedent)
+                    if consequent not in counts or (exact is not None and consequent not in exact):
+                        counts[consequent] = self.count(consequent)
+                        if exact is not None:
+                            exact.add(consequent)
+        found = score_rules(counts, self.n_baskets, self.min_confidence, self.min_lift, basket, within)
+        return self._table(found)
+
+    def rule_table(self):
+        """Every rule of the lattice (what the regular miner would emit, with derived ids)."""
+        counts = self._expand(range(len(self)))
+        return self._table(score_rules(counts, self.n_baskets, self.min_confidence, self.min_lift))
+
+
+def mine_closed(baskets, min_support=0.01, min_confidence=0.2, min_lift=1.0, max_len=4, products=None, n_jobs=1):
+    """Mine ``(ClosedItemsets, STATS)`` from an iterable of baskets (see miner.mine_rules)."""
+    matrix = build_basket_matrix(baskets, products=products, shared=n_jobs != 1)
+    try:
+        frequent = frequent_itemsets(matrix, min_support, max_len, n_jobs)
+        closed = ClosedItemsets.from_frequent(frequent, matrix.n_baskets, matrix.products, min_confidence, min_lift)
+        return closed, compute_stats(matrix)
+    finally:
+        matrix.close()
@@ -0,0 +1,197 @@
+"""
+Utilidades del modo LLM independientes de la UI.
+- Cliente OpenAI reutilizable: pool de conexiones keep-alive, timeouts y reintentos con backoff.
+- Estadísticas de llamadas, reintentos y latencia (hooks de eventos HTTP).
+- Lectura en streaming de completions compatibles con OpenAI.
+- Resolución incremental de citas [Rxx] mientras llega el texto.
+- Llamada bloqueante para un hilo de trabajo (modo híbrido) y contraste de citas LLM vs. reglas.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+
+from perf import span
+
+# "[R04]", "[R0012]" or grouped "[R04, R06]"
+CITATION_RE = re.compile(r"\[\s*(R\d+(?:\s*[,;]\s*R\d+)*)\s*\]")
+_RULE_ID_RE = re.compile(r"R\d+")
+# longest unfinished citation kept back between chunks
+MAX_CITATION_CHARS = 64
+
+LLM_TIMEOUT_SECONDS = 60.0
+LLM_CONNECT_TIMEOUT_SECONDS = 5.0
+# the SDK retries 408/409/429/5xx and connection errors with exponential backoff + jitter
+LLM_MAX_RETRIES = 3
+LATENCY_WINDOW = 200
+
+
+def cited_rule_ids(text):
+    """Rule ids cited in ``text`` in order of first appearance."""
+    seen = []
+    for match in CITATION_RE.finditer(text):
+        for rid in _RULE_ID_RE.findall(match.group(1)):
+            if rid not in seen:
+                seen.append(rid)
+    return seen
+
+
+class CitationTracker:
+    """Feed streamed text deltas; ``feed`` returns the rule ids cited for the first time in them.
+
+    A citation split across chunks ("[R0" + "4]") is resolved once its closing bracket arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.cited = []
+        self._scanned = 0
+
+    def feed(self, delta):
+        self.text += delta
+        new = []
+        pos = self._scanned
+        for match in CITATION_RE.finditer(self.text, pos):
+            for rid in _RULE_ID_RE.findall(match.group(1)):
+                if rid not in self.cited:
+                    self.cited.append(rid)
+                    new.append(rid)
+            pos = match.end()
+        # rescan from an open "[" that may still become a citation
+        open_at = self.text.rfind("[", pos)
+        if open_at != -1 and len(self.text) - open_at <= MAX_CITATION_CHARS:
+            self._scanned = open_at
+        else:
+            self._scanned = len(self.text)
+        return new
+
+
+def iter_stream_text(stream):
+    """Text deltas from an OpenAI chat completion stream (``stream=True``)."""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def run_completion(client, request, stream=True, deltas=None, stats=None):
+    """Blocking chat completion meant for a worker thread; returns the full text.
+
+    Text deltas are put on ``deltas`` (a ``queue.Queue``) as they arrive, followed by a ``None``
+    sentinel that is sent even when the call fails, so the reader never waits forever.
+    """
+    parts = []
+    try:
+        with stats.track() if stats is not None else nullcontext():
+            # for streams this is the wait for the response headers, the body is the "openai.stream" span
+            with span("openai.chat.completions.create"):
+                if stream:
+                    pieces = iter_stream_text(client.chat.completions.create(stream=True, **request))
+                else:
+                    pieces = [client.chat.completions.create(**request).choices[0].message.content or ""]
+            with span("openai.stream"):
+                for delta in pieces:
+                    parts.append(delta)
+                    if deltas is not None:
+                        deltas.put(delta)
+    finally:
+        if deltas is not None:
+            deltas.put(None)
+    return "".join(parts)
+
+
+def cross_check_citations(llm_ids, rule_ids, known_ids):
+    """Compare the rules cited by the LLM with the ones the local engine used.
+
+    ``unknown`` are LLM citations outside ``known_ids`` (the rules it was shown): likely invented.
+    """
+    rule_set = set(rule_ids)
+    known = set(known_ids)
+    return {
+        "agreed": [rid for rid in llm_ids if rid in rule_set],
+        "llm_only": [rid for rid in llm_ids if rid not in rule_set and rid in known],
+        "rules_only": [rid for rid in rule_ids if rid not in set(llm_ids)],
+        "unknown": [rid for rid in llm_ids if rid not in known],
+    }
+
+
+class ClientStats:
+    """Counters fed by the HTTP client's event hooks plus per-call latency (thread-safe)."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.calls = 0
+        self.failures = 0
+        self.attempts = 0
+        self.statuses = Counter()
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        with self._lock:
+            self.attempts += 1
+
+    def on_response(self, response):
+        with self._lock:
+            self.statuses[response.status_code] += 1
+
+    @contextmanager
+    def track(self):
+        """Wrap one logical completion call (including consuming its stream)."""
+        with self._lock:
+            self.calls += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - started)
+
+    @property
+    def retries(self):
+        # every HTTP attempt beyond the first of each call
+        return max(0, self.attempts - self.calls)
+
+    def percentile(self, q):
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rate_limited": self.statuses[429],
+            "server_errors": sum(n for status, n in self.statuses.items() if status >= 500),
+            "p50_ms": None if self.percentile(0.5) is None else round(self.percentile(0.5) * 1000, 1),
+            "p95_ms": None if self.percentile(0.95) is None else round(self.percentile(0.95) * 1000, 1),
+        }
+
+
+def make_openai_client(api_key, stats=None, base_url=None, timeout=LLM_TIMEOUT_SECONDS,
+                       connect_timeout=LLM_CONNECT_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES):
+    """OpenAI client meant to be kept and reused: its HTTP pool keeps connections (and TLS) alive.
+
+    ``base_url`` defaults to ``OPENAI_BASE_URL`` / the public API (see fake_openai_server.py).
+    """
+    import openai
+
+    hooks = {"request": [stats.on_request], "response": [stats.on_response]} if stats is not None else {}
+    # DefaultHttpxClient keeps the SDK's pool limits and adds our timeouts and hooks
+    http_client = openai.DefaultHttpxClient(
+        timeout=openai.Timeout(timeout, connect=connect_timeout),
+        event_hooks=hooks,
+    )
+    return openai.OpenAI(api_key=api_key, base_url=base_url, timeout=openai.Timeout(timeout, connect=connect_timeout),
+                         max_retries=max_retries, http_client=http_client)
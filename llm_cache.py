@@ -0,0 +1,91 @@
+"""
+Caché persistente de respuestas del modo LLM (SQLite).
+- Clave: pregunta normalizada + modelo + temperatura + hash del system prompt (cambia con las reglas).
+- TTL por entrada y recorte LRU; contadores de hits/misses para la barra lateral.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from product_matcher import normalize
+
+DEFAULT_PATH = os.environ.get("AURORA_LLM_CACHE", ".aurora_llm_cache.sqlite")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+MAX_ENTRIES = 5000
+
+
+def prompt_hash(system_prompt):
+    return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # one connection shared by Streamlit's script threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, question TEXT, model TEXT, response TEXT,"
+                " created REAL, last_used REAL, uses INTEGER DEFAULT 0)"
+            )
+
+    @staticmethod
+    def make_key(question, model, temperature, system_prompt):
+        payload = json.dumps([normalize(question), model, round(float(temperature), 3), prompt_hash(system_prompt)])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ?, uses = uses + 1 WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response, question="", model=""):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, question, model, response, created, last_used, uses)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, question, model, response, now, now),
+            )
+            self._prune(now)
+
+    def _prune(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
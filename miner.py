@@ -0,0 +1,465 @@
+"""
+Minero de reglas de asociación sobre pedidos históricos.
+- Matriz de canastas bit-packed (una fila de bits por producto, un bit por orden).
+- Conteo de soporte vectorizado con NumPy (AND + popcount) y poda Apriori por prefijos.
+- Emite reglas con el mismo formato que RULES/STATS en chatbot.py.
+
+Uso:
+    python miner.py orders.csv --order-col order_id --product-col product --out rules.json [--snapshot rules.snap]
+    python miner.py orders.csv --closed --out closed.json --snapshot closed.snap   # ver itemsets.py
+"""
+
+import json
+import logging
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+
+from products import ProductDictionary
+
+# Baskets are packed in blocks of this many orders (must be a multiple of 64)
+CHUNK_BASKETS = 65536
+# Upper bound for the temporary (extensions x words) arrays used while counting
+COUNT_BLOCK_BYTES = 64 * 1024 * 1024
+# Below this many 64-order words per worker the process pool costs more than it saves
+MIN_WORDS_PER_JOB = 1024
+
+log = logging.getLogger("aurora.miner")
+
+if hasattr(np, "bitwise_count"):
+    def popcount_rows(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount_rows(words):
+        words = np.ascontiguousarray(words)
+        return _POP8[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+class BasketMatrix:
+    """Vertical bitset layout: ``bits[item]`` has bit ``b`` set when order ``b`` contains the item."""
+
+    def __init__(self, products, bits, n_baskets, total_items, shm=None):
+        self.products = products
+        self.bits = bits
+        self.n_baskets = n_baskets
+        self.total_items = total_items
+        # SharedMemory block holding ``bits`` (BasketMatrixBuilder.finish(shared=True)); workers attach to it
+        self.shm = shm
+
+    @property
+    def labels(self):
+        return self.products.labels
+
+    @property
+    def n_items(self):
+        return self.bits.shape[0]
+
+    def item_counts(self):
+        return popcount_rows(self.bits)
+
+    def close(self):
+        """Release the shared block, if any (``bits`` is unusable afterwards)."""
+        if self.shm is not None:
+            self.bits = None
+            self.shm.unlink()
+            try:
+                self.shm.close()
+            except BufferError:  # a view is still alive; the mapping goes when it does
+                pass
+            self.shm = None
+
+
+class BasketMatrixBuilder:
+    """Accumulates baskets chunk by chunk so the full order history is never held as Python lists."""
+
+    def __init__(self, chunk_baskets=CHUNK_BASKETS, products=None):
+        if chunk_baskets % 64:
+            raise ValueError("chunk_baskets must be a multiple of 64")
+        self.chunk_baskets = chunk_baskets
+        self.products = ProductDictionary() if products is None else products
+        self.n_baskets = 0
+        self.total_items = 0
+        self._blocks = []
+        # compact int buffers for the current chunk (no per-line Python objects)
+        self._rows = array("i")
+        self._cols = array("i")
+        self._pending = 0
+
+    def add(self, basket):
+        n_lines = 0
+        intern = self.products.add
+        for label in basket:
+            n_lines += 1
+            self._rows.append(intern(label))
+            self._cols.append(self._pending)
+        if not n_lines:
+            return
+        self.total_items += n_lines
+        self._pending += 1
+        self.n_baskets += 1
+        if self._pending == self.chunk_baskets:
+            self._flush()
+
+    def add_many(self, baskets):
+        for basket in baskets:
+            self.add(basket)
+        return self
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows = np.frombuffer(self._rows, dtype=np.int32)
+        cols = np.frombuffer(self._cols, dtype=np.int32)
+        # set bit (basket % 64) of word (product, basket // 64) directly: no dense products x baskets array
+        packed = np.zeros((len(self.products), -(-self._pending // 64)), dtype=np.uint64)
+        np.bitwise_or.at(packed, (rows, cols >> 6), np.uint64(1) << (cols & 63).astype(np.uint64))
+        self._blocks.append(packed)
+        self._rows, self._cols, self._pending = array("i"), array("i"), 0
+
+    def finish(self, shared=False):
+        """The BasketMatrix; ``shared`` builds it in a SharedMemory block that counting workers attach to."""
+        self._flush()
+        shape = (len(self.products), sum(block.shape[1] for block in self._blocks))
+        shm = None
+        if shared:
+            from multiprocessing import shared_memory
+
+            shm = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+            # a new block is zero-filled
+            bits = np.ndarray(shape, dtype=np.uint64, buffer=shm.buf)
+        else:
+            bits = np.zeros(shape, dtype=np.uint64)
+        # untouched pages of the new matrix are not resident yet and each block is freed once copied,
+        # so peak memory stays near one matrix
+        offset = 0
+        while self._blocks:
+            block = self._blocks.pop(0)
+            bits[:block.shape[0], offset:offset + block.shape[1]] = block
+            offset += block.shape[1]
+            del block
+        return BasketMatrix(self.products, bits, self.n_baskets, self.total_items, shm)
+
+
+def build_basket_matrix(baskets, chunk_baskets=CHUNK_BASKETS, products=None, shared=False):
+    return BasketMatrixBuilder(chunk_baskets, products).add_many(baskets).finish(shared)
+
+
+def _count_extensions(bits, prefix, extensions):
+    """Support counts of ``prefix + (e,)`` for every ``e`` in ``extensions``."""
+    prefix_bits = bits[prefix[0]].copy()
+    for item in prefix[1:]:
+        prefix_bits &= bits[item]
+    step = max(1, COUNT_BLOCK_BYTES // max(1, prefix_bits.nbytes))
+    counts = np.empty(len(extensions), dtype=np.int64)
+    for start in range(0, len(extensions), step):
+        block = bits[extensions[start:start + step]] & prefix_bits
+        counts[start:start + step] = popcount_rows(block)
+    return counts
+
+
+def _candidate_tasks(level, frequent):
+    """Prefix-join the sorted frequent k-itemsets and keep candidates whose k-subsets are all frequent."""
+    tasks = []
+    start = 0
+    while start < len(level):
+        head = level[start][:-1]
+        end = start
+        while end < len(level) and level[end][:-1] == head:
+            end += 1
+        tails = [itemset[-1] for itemset in level[start:end]]
+        for i, a in enumerate(tails[:-1]):
+            prefix = head + (a,)
+            extensions = []
+            for b in tails[i + 1:]:
+                candidate = prefix + (b,)
+                # the two subsets dropping a or b are already frequent by construction
+                if all(candidate[:j] + candidate[j + 1:] in frequent for j in range(len(candidate) - 2)):
+                    extensions.append(b)
+            if extensions:
+                tasks.append((prefix, np.asarray(extensions, dtype=np.int64)))
+        start = end
+    return tasks
+
+
+def _count_tasks(bits, tasks):
+    return [_count_extensions(bits, prefix, extensions) for prefix, extensions in tasks]
+
+
+_WORKER = {}
+
+
+def _attach_shard(shm_name, shape, lo, hi):
+    from multiprocessing import shared_memory
+
+    # the worker counts on a view of its columns: the matrix is never copied per process
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _WORKER["shm"] = shm
+    _WORKER["bits"] = np.ndarray(shape, dtype=np.uint64, buffer=shm.buf)[:, lo:hi]
+
+
+def _count_worker_tasks(tasks):
+    return _count_tasks(_WORKER["bits"], tasks)
+
+
+class SupportCounter:
+    """Counts candidate supports, optionally split by basket ranges across a process pool.
+
+    Each worker reads a slice of the order axis (64 orders per word) of the shared matrix and returns
+    partial counts that are summed here; counts are exact integers, so results match a single-process run.
+    Pass the matrix's SharedMemory as ``shm`` to avoid copying ``bits`` into a new block.
+    """
+
+    def __init__(self, bits, n_jobs=1, shm=None):
+        requested = (os.cpu_count() or 1) if n_jobs is None or n_jobs <= 0 else n_jobs
+        n_jobs = max(1, min(requested, bits.shape[1] // MIN_WORDS_PER_JOB))
+        if n_jobs < requested:
+            log.warning("support counting on %d of %d requested processes (each needs %d+ orders)",
+                        n_jobs, requested, MIN_WORDS_PER_JOB * 64)
+        else:
+            log.info("support counting on %d process(es)", n_jobs)
+        self.bits = bits
+        self.n_jobs = n_jobs
+        self._pools = []
+        self._shm = None
+        if n_jobs > 1:
+            if shm is None:
+                from multiprocessing import shared_memory
+
+                shm = self._shm = shared_memory.SharedMemory(create=True, size=max(1, bits.nbytes))
+                np.ndarray(bits.shape, dtype=np.uint64, buffer=shm.buf)[:] = bits
+            bounds = np.linspace(0, bits.shape[1], n_jobs + 1).astype(int)
+            # one single-worker pool per shard so every shard stays pinned to its process
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                self._pools.append(ProcessPoolExecutor(
+                    max_workers=1, initializer=_attach_shard,
+                    initargs=(shm.name, bits.shape, int(lo), int(hi)),
+                ))
+
+    def count(self, tasks):
+        if not self._pools:
+            return _count_tasks(self.bits, tasks)
+        futures = [pool.submit(_count_worker_tasks, tasks) for pool in self._pools]
+        partials = [f.result() for f in futures]
+        return [sum(parts) for parts in zip(*partials)]
+
+    def close(self):
+        for pool in self._pools:
+            pool.shutdown()
+        self._pools = []
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def frequent_itemsets(matrix, min_support=0.01, max_len=4, n_jobs=1):
+    """Return ``{itemset (sorted item ids): order count}`` for every itemset with support >= min_support.
+
+    ``n_jobs`` > 1 splits support counting across processes (``n_jobs`` <= 0 uses every core).
+    """
+    min_count = max(1, math.ceil(min_support * matrix.n_baskets))
+    counts = matrix.item_counts()
+    frequent = {(int(i),): int(counts[i]) for i in np.flatnonzero(counts >= min_count)}
+    level = sorted(frequent)
+    k = 1
+    with SupportCounter(matrix.bits, n_jobs, matrix.shm) as counter:
+        while level and k < max_len:
+            next_level = []
+            tasks = _candidate_tasks(level, frequent)
+            for (prefix, extensions), ext_counts in zip(tasks, counter.count(tasks)):
+                keep = ext_counts >= min_count
+                for item, count in zip(extensions[keep].tolist(), ext_counts[keep].tolist()):
+                    itemset = prefix + (item,)
+                    frequent[itemset] = count
+                    next_level.append(itemset)
+            level = sorted(next_level)
+            k += 1
+    return frequent
+
+
+def score_rules(itemsets, n_baskets, min_confidence=0.2, min_lift=1.0, touching=None, within=None):
+    """``[(antecedent ids, consequent ids, support, confidence, lift)]``, strongest first.
+
+    ``touching`` / ``within`` (sets of item ids) keep only the rules whose antecedent shares an item
+    with them / lies inside them.
+    """
+    found = []
+    for itemset, count in itemsets.items():
+        if len(itemset) < 2 or (touching is not None and touching.isdisjoint(itemset)):
+            continue
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                if touching is not None and touching.isdisjoint(antecedent):
+                    continue
+                if within is not None and not within.issuperset(antecedent):
+                    continue
+                consequent = tuple(i for i in itemset if i not in antecedent)
+                if antecedent not in itemsets or consequent not in itemsets:
+                    continue
+                confidence = count / itemsets[antecedent]
+                if confidence < min_confidence:
+                    continue
+                lift = confidence / (itemsets[consequent] / n_baskets)
+                if lift < min_lift:
+                    continue
+                found.append((antecedent, consequent, count / n_baskets, confidence, lift))
+    # deterministic order: strongest rules first, ties broken by item ids
+    found.sort(key=lambda x: (-x[4], -x[3], x[0], x[1]))
+    return found
+
+
+def generate_rules(itemsets, n_baskets, products, min_confidence=0.2, min_lift=1.0):
+    """Split every frequent itemset into antecedent => consequent rules (RULES dict format)."""
+    found = score_rules(itemsets, n_baskets, min_confidence, min_lift)
+    width = max(2, len(str(len(found))))
+    decode = products.decode
+    return [
+        {
+            "id": f"R{i:0{width}d}",
+            "antecedent": decode(antecedent),
+            "consequent": decode(consequent),
+            "support": support,
+            "confidence": confidence,
+            "lift": lift,
+        }
+        for i, (antecedent, consequent, support, confidence, lift) in enumerate(found, start=1)
+    ]
+
+
+class StatsAccumulator:
+    """Running totals behind STATS; new baskets are added without revisiting old ones."""
+
+    def __init__(self, products=None):
+        self.products = ProductDictionary() if products is None else products
+        self.n_orders = 0
+        self.total_items = 0
+        self.item_counts = np.zeros(0, dtype=np.int64)
+
+    def add_counts(self, item_counts, n_orders, total_items):
+        if len(item_counts) > len(self.item_counts):
+            grown = np.zeros(len(item_counts), dtype=np.int64)
+            grown[:len(self.item_counts)] = self.item_counts
+            self.item_counts = grown
+        self.item_counts[:len(item_counts)] += item_counts
+        self.n_orders += n_orders
+        self.total_items += total_items
+        return self
+
+    def add_matrix(self, matrix):
+        return self.add_counts(matrix.item_counts(), matrix.n_baskets, matrix.total_items)
+
+    def to_stats(self, top_n=5):
+        counts = self.item_counts
+        n = max(1, self.n_orders)
+        top = np.argsort(-counts, kind="stable")[:top_n]
+        return {
+            "total_orders": self.n_orders,
+            "unique_products": int(np.count_nonzero(counts)),
+            "avg_basket_size": round(self.total_items / n, 2),
+            "total_items_sold": self.total_items,
+            "top_products_support": [(self.products.labels[i], round(int(counts[i]) / n, 3)) for i in top],
+        }
+
+
+def compute_stats(matrix, top_n=5):
+    return StatsAccumulator(matrix.products).add_matrix(matrix).to_stats(top_n)
+
+
+def mine_rules(baskets, min_support=0.01, min_confidence=0.2, min_lift=1.0, max_len=4, products=None, n_jobs=1):
+    """Mine ``(RULES, STATS)`` from an iterable of baskets (each an iterable of product labels)."""
+    matrix = build_basket_matrix(baskets, products=products, shared=n_jobs != 1)
+    try:
+        itemsets = frequent_itemsets(matrix, min_support, max_len, n_jobs)
+        rules = generate_rules(itemsets, matrix.n_baskets, matrix.products, min_confidence, min_lift)
+        return rules, compute_stats(matrix)
+    finally:
+        matrix.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mine association rules from an order-line CSV/Parquet export.")
+    parser.add_argument("orders")
+    parser.add_argument("--order-col", default="order_id")
+    parser.add_argument("--product-col", default="product")
+    parser.add_argument("--min-support", type=float, default=0.01)
+    parser.add_argument("--min-confidence", type=float, default=0.2)
+    parser.add_argument("--min-lift", type=float, default=1.0)
+    parser.add_argument("--max-len", type=int, default=4)
+    parser.add_argument("--jobs", type=int, default=1, help="support-counting processes (0 = all cores)")
+    parser.add_argument("--out", default="rules.json")
+    parser.add_argument("--snapshot", help="also write a binary rules snapshot (see snapshot.py)")
+    parser.add_argument("--prune", action="store_true", help="drop redundant rules before writing (see pruning.py)")
+    parser.add_argument("--closed", action="store_true",
+                        help="store closed frequent itemsets and derive rules at query time (see itemsets.py)")
+    parser.add_argument("--allow-split-orders", action="store_true",
+                        help="mine even if an export not grouped by order had orders split into several baskets")
+    args = parser.parse_args(argv)
+    if args.closed and args.prune:
+        parser.error("--prune cannot be combined with --closed (--closed stores itemsets, not rules)")
+
+    from ingest import SplitOrdersError
+
+    try:
+        if args.closed:
+            return _main_closed(args)
+        return _main_rules(args)
+    except SplitOrdersError as exc:
+        parser.error(f"{exc}, or pass --allow-split-orders")
+
+
+def _main_rules(args):
+    from ingest import mine_file
+
+    rules, stats, report = mine_file(args.orders, args.order_col, args.product_col, args.min_support,
+                                     args.min_confidence, args.min_lift, args.max_len, n_jobs=args.jobs,
+                                     allow_split_orders=args.allow_split_orders)
+    print(report)
+    if args.prune:
+        from pruning import prune_rules
+
+        rules, pruned = prune_rules(rules)
+        print(pruned)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump({"rules": rules, "stats": stats}, fh, ensure_ascii=False, indent=2)
+    print(f"{len(rules)} rules from {stats['total_orders']} orders -> {args.out}")
+    if args.snapshot:
+        from rule_store import RuleTable
+        from snapshot import write_snapshot
+
+        write_snapshot(args.snapshot, RuleTable.from_rules(rules, ProductDictionary.from_rules(rules, stats)), stats)
+        print(f"snapshot -> {args.snapshot}")
+
+
+def _main_closed(args):
+    from ingest import mine_file_closed
+
+    itemsets, stats, report = mine_file_closed(args.orders, args.order_col, args.product_col, args.min_support,
+                                               args.min_confidence, args.min_lift, args.max_len, n_jobs=args.jobs,
+                                               allow_split_orders=args.allow_split_orders)
+    print(report)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(dict(itemsets.to_json(), stats=stats), fh, ensure_ascii=False, indent=2)
+    print(f"{len(itemsets)} closed itemsets ({itemsets.n_rules} rules) from {stats['total_orders']} orders -> {args.out}")
+    if args.snapshot:
+        from snapshot import write_itemset_snapshot
+
+        write_itemset_snapshot(args.snapshot, itemsets, stats)
+        print(f"snapshot -> {args.snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Instrumentación liviana de las rutas calientes (detección, match, prompts, OpenAI, render).
+- span("nombre") como context manager y @timed("nombre") como decorador; acumulan por nombre.
+- Apagado por defecto (AURORA_PERF=1 o enable()): con la bandera apagada cada span es un chequeo y nada más.
+- request("nombre") agrupa los spans de una consulta y emite una línea de log JSON (logger "aurora.perf");
+  request(..., enabled=True) mide solo esa consulta sin tocar la bandera global (panel por sesión).
+- Histogramas en formato de texto Prometheus (ver GET /metrics en api_server.py).
+"""
+
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# histogram bucket upper bounds in seconds (Prometheus convention)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# recent durations kept per span for the p50/p95 shown in the panel
+WINDOW = 512
+
+log = logging.getLogger("aurora.perf")
+# spans of the request being served in this thread/task (worker threads join via copy_context)
+_current = contextvars.ContextVar("aurora_perf_request", default=None)
+
+
+class SpanStats:
+    __slots__ = ("count", "total", "max", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.recent = deque(maxlen=WINDOW)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Recorder:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        # with the global flag off, spans only reach the trace of the request that asked for them
+        if self.enabled:
+            with self._lock:
+                stats = self.spans.get(name)
+                if stats is None:
+                    stats = self.spans[name] = SpanStats()
+                stats.add(seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append((name, seconds))
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+
+    def summary(self):
+        """One dict per span name, slowest total first (milliseconds)."""
+        with self._lock:
+            items = list(self.spans.items())
+        rows = [{"span": name, "count": s.count, "total_ms": round(s.total * 1000, 2),
+                 "mean_ms": round(s.total / s.count * 1000, 3), "p50_ms": round(s.percentile(0.5) * 1000, 3),
+                 "p95_ms": round(s.percentile(0.95) * 1000, 3), "max_ms": round(s.max * 1000, 3)}
+                for name, s in items]
+        return sorted(rows, key=lambda r: -r["total_ms"])
+
+    def prometheus(self, prefix="aurora"):
+        metric = f"{prefix}_span_seconds"
+        lines = [f"# HELP {metric} Time spent in instrumented hot-path spans.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            items = sorted(self.spans.items())
+            for name, s in items:
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), s.buckets):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{span="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{span="{label}"}} {s.total:.6f}')
+                lines.append(f'{metric}_count{{span="{label}"}} {s.count}')
+        return "\n".join(lines) + "\n"
+
+
+RECORDER = Recorder(os.environ.get("AURORA_PERF", "") not in ("", "0"))
+_DISABLED = nullcontext()
+
+
+def enable(flag=True):
+    RECORDER.enabled = bool(flag)
+
+
+def enabled():
+    return RECORDER.enabled
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        RECORDER.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def _active():
+    return RECORDER.enabled or _current.get() is not None
+
+
+def span(name):
+    """``with span("engine.match_rules"): ...`` (a shared no-op when instrumentation is off)."""
+    return _Span(name) if _active() else _DISABLED
+
+
+def timed(name=None):
+    """Decorator form of ``span``; the name defaults to the function's qualified name."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active():
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                RECORDER.record(label, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+class RequestTrace:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.spans = []
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return dict(self.fields, event="request", request=self.name, total_ms=round(self.seconds * 1000, 3),
+                    spans=[{"span": name, "ms": round(seconds * 1000, 3)} for name, seconds in self.spans])
+
+
+@contextmanager
+def request(name, enabled=False, **fields):
+    """Collect the spans of one request; yields the RequestTrace (``None`` when off) and logs it as JSON.
+
+    ``enabled=True`` traces this request even with the global flag off (nothing is aggregated then).
+    """
+    if not (RECORDER.enabled or enabled):
+        yield None
+        return
+    trace = RequestTrace(name, fields)
+    token = _current.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.seconds = time.perf_counter() - started
+        _current.reset(token)
+        RECORDER.record(f"request.{name}", trace.seconds)
+        if log.isEnabledFor(logging.INFO):
+            log.info(json.dumps(trace.as_dict(), ensure_ascii=False))
@@ -0,0 +1,132 @@
+"""
+Detector de productos en texto libre (autómata Aho–Corasick).
+- Se compila una vez por catálogo; cada consulta es lineal en el largo del texto.
+- Normaliza acentos, mayúsculas y puntuación ("Maíz" == "maiz").
+- Alias por SKU: nombre corto, palabra principal con plural y alias explícitos.
+"""
+
+import re
+import unicodedata
+
+from products import ProductDictionary
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# label suffixes after these separators are presentation/size details ("- 12 pzas - Docena")
+_NAME_SPLIT_RE = re.compile(r"\s+-\s+|\s*\|\s*|\s*\(")
+MIN_HEAD_WORD_LEN = 4
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse everything that is not a letter/digit into single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(_TOKEN_RE.findall(stripped))
+
+
+def plural_forms(word):
+    if word.endswith("s"):
+        return [word]
+    if word.endswith("y") and len(word) > 1 and word[-2] not in "aeiou":
+        return [word, word[:-1] + "ies"]
+    if word[-1] in "aeiou":
+        return [word, word + "s"]
+    return [word, word + "es"]
+
+
+def default_aliases(label):
+    """Aliases derived from the label itself: full label, short name and head word (+ plural)."""
+    aliases = {normalize(label)}
+    name = normalize(_NAME_SPLIT_RE.split(label, maxsplit=1)[0])
+    if name:
+        aliases.add(name)
+        head = name.split(" ", 1)[0]
+        if len(head) >= MIN_HEAD_WORD_LEN and not head.isdigit():
+            aliases.update(plural_forms(head))
+        if " " in name:
+            # "huevo de gallina" -> "huevos de gallina"
+            rest = name.split(" ", 1)[1]
+            aliases.update(f"{form} {rest}" for form in plural_forms(head))
+    aliases.discard("")
+    return aliases
+
+
+class ProductMatcher:
+    """Automaton over every alias of a catalog; outputs are product ids from a ProductDictionary."""
+
+    def __init__(self, products, aliases=None, derive_aliases=True):
+        if not isinstance(products, ProductDictionary):
+            products = ProductDictionary(products)
+        self.products = products
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        patterns = {}
+        for item, label in enumerate(products.labels):
+            names = default_aliases(label) if derive_aliases else {normalize(label)}
+            for alias in (aliases or {}).get(label, ()):
+                names.add(normalize(alias))
+            for name in names:
+                if name:
+                    patterns.setdefault(name, set()).add(item)
+        for pattern, items in patterns.items():
+            self._insert(pattern, tuple(sorted(items)))
+        self._build_links()
+
+    def _insert(self, pattern, items):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = ((len(pattern), items),)
+
+    def _build_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                state = self._fail[node]
+                while state and ch not in self._goto[state]:
+                    state = self._fail[state]
+                fallback = self._goto[state].get(ch, 0)
+                self._fail[nxt] = fallback if fallback != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def matches(self, text):
+        """Yield ``(start, end, product ids)`` for every alias occurrence aligned on word boundaries."""
+        text = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        n = len(text)
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] and (i + 1 == n or text[i + 1] == " "):
+                for length, items in out[node]:
+                    start = i + 1 - length
+                    if start == 0 or text[start - 1] == " ":
+                        yield start, i + 1, items
+
+    def find_ids(self, text):
+        """Ids of the products mentioned in ``text``; overlapping aliases resolve leftmost-longest."""
+        spans = sorted(self.matches(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        found = set()
+        covered_until = -1
+        for start, end, items in spans:
+            if start < covered_until:
+                continue
+            found.update(items)
+            covered_until = end
+        return sorted(found)
+
+    def find(self, text):
+        return sorted(self.products.decode(self.find_ids(text)))
@@ -0,0 +1,63 @@
+"""
+Diccionario de productos: etiqueta <-> id entero denso.
+- Se construye una vez al cargar reglas/estadísticas.
+- Matching, grafo y minería trabajan con ids; las etiquetas se decodifican solo al renderizar.
+"""
+
+import sys
+
+import numpy as np
+
+
+class ProductDictionary:
+    def __init__(self, labels=()):
+        self.labels = []
+        self.index = {}
+        for label in labels:
+            self.add(label)
+
+    @classmethod
+    def from_rules(cls, rules, stats=None):
+        products = cls()
+        for r in rules:
+            for label in r["antecedent"]:
+                products.add(label)
+            for label in r["consequent"]:
+                products.add(label)
+        if stats:
+            for label, _ in stats["top_products_support"]:
+                products.add(label)
+        return products
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self.index
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def add(self, label):
+        """Intern ``label`` and return its id (existing ids never change)."""
+        item = self.index.get(label)
+        if item is None:
+            label = sys.intern(label)
+            item = self.index[label] = len(self.labels)
+            self.labels.append(label)
+        return item
+
+    def get(self, label, default=None):
+        return self.index.get(label, default)
+
+    def encode(self, labels):
+        """Ids of the known labels; unknown labels are skipped."""
+        index = self.index
+        return np.fromiter((index[p] for p in labels if p in index), dtype=np.int32)
+
+    def decode(self, items):
+        labels = self.labels
+        return [labels[i] for i in items]
+
+    def sorted_labels(self):
+        return sorted(self.labels)
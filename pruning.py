@@ -0,0 +1,270 @@
+"""
+Poda de reglas después de la minería: misma capacidad de recomendación con menos reglas.
+- Itemsets cerrados / maximales: descarta A => C si otra regla A => C' (C ⊂ C') tiene el mismo soporte
+  (cerrados) o simplemente existe (maximales).
+- Consecuentes redundantes: A => C1 sobra si otra regla A' => C2 (A' ⊆ A, C1 ⊆ C2) tiene al menos su
+  confianza: una canasta con A también activa A' y recibe todo C1.
+- Mejora mínima: A => C sobra si un antecedente más chico A' ⊂ A da casi la misma confianza.
+- Top-N por antecedente y, opcional, una sola dirección por par simétrico (A => B / B => A).
+- Reporta cuántas reglas quedan tras cada etapa y cuántos pares (antecedente, producto) siguen cubiertos.
+
+Uso:
+    python pruning.py rules.json --out pruned.json [--snapshot rules.snap] [--top-per-antecedent 5]
+"""
+
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+
+# float32 supports/confidences compare equal within this relative tolerance
+REL_TOL = 1e-4
+MIN_IMPROVEMENT = 0.01
+ITEMSET_MODES = ("closed", "maximal", None)
+
+
+def _close(a, b):
+    return abs(a - b) <= REL_TOL * max(abs(a), abs(b), 1e-12)
+
+
+class PruneReport:
+    def __init__(self, rules_in):
+        self.rules_in = rules_in
+        self.stages = []
+        self.pairs_in = 0
+        self.pairs_out = 0
+
+    def add(self, stage, kept):
+        self.stages.append((stage, kept))
+
+    @property
+    def rules_out(self):
+        return self.stages[-1][1] if self.stages else self.rules_in
+
+    def as_dict(self):
+        return {
+            "rules_in": self.rules_in,
+            "rules_out": self.rules_out,
+            "stages": [{"stage": stage, "rules": kept} for stage, kept in self.stages],
+            "pairs_in": self.pairs_in,
+            "pairs_out": self.pairs_out,
+        }
+
+    def __str__(self):
+        steps = " -> ".join(f"{stage} {kept:,}" for stage, kept in self.stages)
+        return (f"{self.rules_in:,} rules -> {self.rules_out:,} ({steps}); "
+                f"(antecedent, product) pairs covered {self.pairs_out:,}/{self.pairs_in:,}")
+
+
+class _Rules:
+    """Antecedent/consequent item tuples and metrics of a RuleTable as plain Python values."""
+
+    def __init__(self, table):
+        self.ante = [tuple(sorted(table.antecedent_items(i).tolist())) for i in range(len(table))]
+        self.cons = [tuple(sorted(table.consequent_items(i).tolist())) for i in range(len(table))]
+        self.support = table.support.tolist()
+        self.confidence = table.confidence.tolist()
+        self.lift = table.lift.tolist()
+
+    def itemset(self, i):
+        return tuple(sorted(self.ante[i] + self.cons[i]))
+
+
+def _by_antecedent(rules, keep):
+    groups = defaultdict(list)
+    for i in keep:
+        groups[rules.ante[i]].append(i)
+    return groups.values()
+
+
+def _consequent_supersets(rules, keep):
+    """Yield ``(i, j)`` for rules with the same antecedent where ``cons(i) ⊊ cons(j)``."""
+    for group in _by_antecedent(rules, keep):
+        if len(group) < 2:
+            continue
+        # consequent postings inside the group: candidates are the rules holding every item of cons(i)
+        postings = defaultdict(list)
+        for j in group:
+            for item in rules.cons[j]:
+                postings[item].append(j)
+        for i in group:
+            lists = sorted((postings[item] for item in rules.cons[i]), key=len)
+            size = len(rules.cons[i])
+            for j in set(lists[0]).intersection(*lists[1:]):
+                if len(rules.cons[j]) > size:
+                    yield i, j
+
+
+def itemset_filter(rules, keep, mode="closed"):
+    """Rules on closed (no superset with the same support) or maximal (no superset at all) itemsets.
+
+    Only supersets reached by a kept rule with the same antecedent count, so every product a dropped
+    rule recommended is still recommended for that antecedent.
+    """
+    dropped = set()
+    for i, j in _consequent_supersets(rules, keep):
+        if mode == "maximal" or _close(rules.support[i], rules.support[j]):
+            dropped.add(i)
+    return [i for i in keep if i not in dropped]
+
+
+def _consequent_index(rules, keep):
+    """``{antecedent: {product: kept rules with that antecedent whose consequent holds the product}}``."""
+    index = defaultdict(lambda: defaultdict(list))
+    for j in keep:
+        postings = index[rules.ante[j]]
+        for item in rules.cons[j]:
+            postings[item].append(j)
+    return index
+
+
+def redundant_consequents(rules, keep):
+    """Drop ``A => C1`` when a kept ``A' => C2`` with ``A' ⊆ A`` and ``C1 ⊆ C2`` reaches at least its confidence.
+
+    Rules dominate along a strict partial order, so every dropped rule has an undropped dominator.
+    """
+    index = _consequent_index(rules, keep)
+    dropped = set()
+    for i in keep:
+        ante, cons = rules.ante[i], rules.cons[i]
+        floor = rules.confidence[i] * (1 - REL_TOL)
+        subsets = (sub for size in range(len(ante), 0, -1) for sub in combinations(ante, size))
+        for sub in subsets:
+            postings = index.get(sub)
+            if postings is None:
+                continue
+            lists = sorted((postings.get(item, ()) for item in cons), key=len)
+            if any(j != i and rules.confidence[j] >= floor for j in set(lists[0]).intersection(*lists[1:])):
+                dropped.add(i)
+                break
+    return [i for i in keep if i not in dropped]
+
+
+def min_improvement(rules, keep, threshold=MIN_IMPROVEMENT):
+    """Keep ``A => C`` only if it beats every ``A' => C`` (A' ⊂ A) by at least ``threshold`` confidence."""
+    best = {}
+    for i in keep:
+        key = (rules.ante[i], rules.cons[i])
+        best[key] = max(best.get(key, 0.0), rules.confidence[i])
+    out = []
+    for i in keep:
+        ante, cons = rules.ante[i], rules.cons[i]
+        simpler = (best.get((sub, cons)) for size in range(1, len(ante)) for sub in combinations(ante, size))
+        baseline = max((c for c in simpler if c is not None), default=None)
+        if baseline is None or rules.confidence[i] - baseline >= threshold:
+            out.append(i)
+    return out
+
+
+def top_per_antecedent(rules, keep, n):
+    chosen = set()
+    for group in _by_antecedent(rules, keep):
+        group.sort(key=lambda i: (-rules.lift[i], -rules.confidence[i], i))
+        chosen.update(group[:n])
+    return [i for i in keep if i in chosen]
+
+
+def dedupe_symmetric(rules, keep):
+    """Of ``A => B`` and ``B => A`` keep the higher-confidence direction (lift is the same for both)."""
+    best = {}
+    for i in keep:
+        key = frozenset((rules.ante[i], rules.cons[i]))
+        j = best.get(key)
+        if j is None or (rules.confidence[i], -i) > (rules.confidence[j], -j):
+            best[key] = i
+    chosen = set(best.values())
+    return [i for i in keep if i in chosen]
+
+
+def recommendation_pairs(rules, keep):
+    """Distinct ``(antecedent, consequent product)`` pairs: what a basket equal to the antecedent gets."""
+    return {(rules.ante[i], item) for i in keep for item in rules.cons[i]}
+
+
+def covered_pairs(rules, pairs, keep):
+    """How many ``pairs`` a basket equal to the antecedent still gets from the ``keep`` rules
+    (through the same antecedent or any subset of it)."""
+    kept = recommendation_pairs(rules, keep)
+    return sum(1 for ante, item in pairs
+               if any((sub, item) in kept for size in range(1, len(ante) + 1) for sub in combinations(ante, size)))
+
+
+def prune_table(table, itemsets="closed", redundant=True, improvement=MIN_IMPROVEMENT, top_n=None,
+                symmetric=False):
+    """Indices of the rules that survive pruning (original order) and a PruneReport.
+
+    Stages run in order: itemsets (``"closed"``, ``"maximal"`` or ``None``), redundant consequents,
+    minimum improvement (``None`` skips it), top-N per antecedent, symmetric dedupe.
+    """
+    if itemsets not in ITEMSET_MODES:
+        raise ValueError(f"unknown itemset mode {itemsets!r} (expected closed, maximal or None)")
+    rules = _Rules(table)
+    keep = list(range(len(table)))
+    report = PruneReport(len(keep))
+    pairs = recommendation_pairs(rules, keep)
+    report.pairs_in = len(pairs)
+    if itemsets:
+        keep = itemset_filter(rules, keep, itemsets)
+        report.add(itemsets, len(keep))
+    if redundant:
+        keep = redundant_consequents(rules, keep)
+        report.add("redundant_consequents", len(keep))
+    if improvement is not None:
+        keep = min_improvement(rules, keep, improvement)
+        report.add("min_improvement", len(keep))
+    if top_n:
+        keep = top_per_antecedent(rules, keep, top_n)
+        report.add(f"top_{top_n}_per_antecedent", len(keep))
+    if symmetric:
+        keep = dedupe_symmetric(rules, keep)
+        report.add("symmetric", len(keep))
+    report.pairs_out = covered_pairs(rules, pairs, keep)
+    return np.asarray(keep, dtype=np.int64), report
+
+
+def prune_rules(rules, products=None, **options):
+    """``prune_table`` for RULES dicts; returns ``(kept rules, PruneReport)`` with the original ids."""
+    from rule_store import RuleTable
+
+    table = RuleTable.from_rules(rules, products)
+    keep, report = prune_table(table, **options)
+    return [rules[i] for i in keep.tolist()], report
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Prune redundant association rules from miner.py JSON output.")
+    parser.add_argument("rules_json")
+    parser.add_argument("--out", help="pruned JSON (default: only print the report)")
+    parser.add_argument("--snapshot", help="also write a binary rules snapshot of the pruned rules")
+    parser.add_argument("--itemsets", choices=("closed", "maximal", "none"), default="closed")
+    parser.add_argument("--keep-redundant", action="store_true", help="skip redundant-consequent elimination")
+    parser.add_argument("--min-improvement", type=float, default=MIN_IMPROVEMENT, help="negative disables it")
+    parser.add_argument("--top-per-antecedent", type=int, help="keep the N strongest rules per antecedent")
+    parser.add_argument("--symmetric", action="store_true", help="keep one direction of A => B / B => A")
+    args = parser.parse_args(argv)
+
+    with open(args.rules_json, encoding="utf-8") as fh:
+        data = json.load(fh)
+    kept, report = prune_rules(
+        data["rules"], itemsets=None if args.itemsets == "none" else args.itemsets,
+        redundant=not args.keep_redundant, improvement=None if args.min_improvement < 0 else args.min_improvement,
+        top_n=args.top_per_antecedent, symmetric=args.symmetric,
+    )
+    print(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(dict(data, rules=kept, pruning=report.as_dict()), fh, ensure_ascii=False, indent=2)
+    if args.snapshot:
+        from products import ProductDictionary
+        from rule_store import RuleTable
+        from snapshot import write_snapshot
+
+        stats = data["stats"]
+        write_snapshot(args.snapshot, RuleTable.from_rules(kept, ProductDictionary.from_rules(kept, stats)), stats)
+
+
+if __name__ == "__main__":
+    main()
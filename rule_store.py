@@ -0,0 +1,311 @@
+"""
+Almacén de reglas en formato columnar con índice invertido producto -> reglas.
+- RuleTable: ids de producto enteros en arreglos CSR (offsets + items) y métricas float32.
+- Filtros por umbral, ordenamiento y top-k vectorizados con NumPy.
+- RuleStore: las consultas solo tocan las reglas que comparten algún producto con la canasta.
+- Tablas chicas (p. ej. las reglas derivadas por canasta en modo cerrado) comparan antecedentes como
+  bitsets uint64: match completo = (a & b) == a, parcial = a & b != 0.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+from products import ProductDictionary
+
+METRICS = ("support", "confidence", "lift")
+# Antecedents are kept as uint64 bitsets for catalogs up to 64 * MAX_BITSET_WORDS products; beyond
+# that a bitset per rule costs more memory than it saves and full matches come from posting hit counts.
+MAX_BITSET_WORDS = 16
+# Up to this many rules one dense bitset pass beats walking the postings; larger stores build no bitsets
+DENSE_MATCH_RULES = 256
+
+
+def as_float64(values):
+    """float32 metrics as the float64 of their shortest decimal form (0.0106, not 0.010599999688565731)."""
+    return np.asarray(values).astype(str).astype(np.float64)
+
+
+def _csr(groups, products):
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(g) for g in groups])
+    items = np.fromiter((products.add(p) for g in groups for p in g), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, items
+
+
+class RuleTable:
+    """Columnar rules: rule ``i`` has antecedent ``ante_items[ante_offsets[i]:ante_offsets[i + 1]]``."""
+
+    def __init__(self, ids, products, ante_offsets, ante_items, cons_offsets, cons_items,
+                 support, confidence, lift):
+        self.ids = ids
+        self.products = products
+        self.ante_offsets = ante_offsets
+        self.ante_items = ante_items
+        self.cons_offsets = cons_offsets
+        self.cons_items = cons_items
+        self.support = support
+        self.confidence = confidence
+        self.lift = lift
+
+    @classmethod
+    def from_rules(cls, rules, products=None):
+        rules = list(rules)
+        products = ProductDictionary() if products is None else products
+        ante_offsets, ante_items = _csr([r["antecedent"] for r in rules], products)
+        cons_offsets, cons_items = _csr([r["consequent"] for r in rules], products)
+        metrics = {m: np.fromiter((r[m] for r in rules), dtype=np.float32, count=len(rules)) for m in METRICS}
+        return cls(np.array([r["id"] for r in rules], dtype=str), products,
+                   ante_offsets, ante_items, cons_offsets, cons_items, **metrics)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        arrays = (self.ids, self.ante_offsets, self.ante_items, self.cons_offsets, self.cons_items,
+                  self.support, self.confidence, self.lift)
+        return sum(a.nbytes for a in arrays)
+
+    def antecedent_items(self, i):
+        return self.ante_items[self.ante_offsets[i]:self.ante_offsets[i + 1]]
+
+    def consequent_items(self, i):
+        return self.cons_items[self.cons_offsets[i]:self.cons_offsets[i + 1]]
+
+    def antecedent_sizes(self):
+        return np.diff(self.ante_offsets)
+
+    def decode(self, items):
+        return self.products.decode(items)
+
+    def rule(self, i):
+        """Rule ``i`` as the classic RULES dict (labels decoded on demand)."""
+        return {
+            "id": str(self.ids[i]),
+            "antecedent": self.decode(self.antecedent_items(i)),
+            "consequent": self.decode(self.consequent_items(i)),
+            "support": float(str(self.support[i])),
+            "confidence": float(str(self.confidence[i])),
+            "lift": float(str(self.lift[i])),
+        }
+
+    def to_rules(self, indices=None):
+        indices = range(len(self)) if indices is None else indices
+        return [self.rule(i) for i in indices]
+
+    def filter(self, min_support=0.0, min_confidence=0.0, min_lift=0.0):
+        """Indices of the rules meeting every threshold."""
+        mask = (self.support >= min_support) & (self.confidence >= min_confidence) & (self.lift >= min_lift)
+        return np.flatnonzero(mask)
+
+    def order(self, indices=None):
+        """Indices sorted by lift desc, then confidence desc (stable on the original position)."""
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        return indices[np.lexsort((-self.confidence[indices], -self.lift[indices]))]
+
+    def top_k(self, k, by="lift", indices=None):
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        values = getattr(self, by)[indices]
+        if k < len(indices):
+            keep = np.argpartition(-values, k - 1)[:k]
+            indices, values = indices[keep], values[keep]
+        return indices[np.argsort(-values, kind="stable")]
+
+    def _joined(self, offsets, items, sep):
+        labels = self.products.labels
+        return [sep.join(labels[j] for j in items[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+    def antecedent_strings(self, sep=" + "):
+        return self._joined(self.ante_offsets, self.ante_items, sep)
+
+    def consequent_strings(self, sep=" + "):
+        return self._joined(self.cons_offsets, self.cons_items, sep)
+
+    def to_frame(self, indices=None):
+        import pandas as pd
+
+        table = self if indices is None else self.take(indices)
+        return pd.DataFrame({
+            "id": table.ids,
+            "antecedent": table.antecedent_strings(),
+            "consequent": table.consequent_strings(),
+            "support": as_float64(table.support),
+            "confidence": as_float64(table.confidence),
+            "lift": as_float64(table.lift),
+        })
+
+    def take(self, indices):
+        """New table holding only ``indices`` (in that order); product ids are preserved."""
+        indices = np.asarray(indices, dtype=np.int64)
+
+        def gather(offsets, items):
+            starts, ends = offsets[indices], offsets[indices + 1]
+            new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+            new_offsets[1:] = np.cumsum(ends - starts)
+            pos = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1] - starts, ends - starts)
+            return new_offsets, items[pos]
+
+        ante_offsets, ante_items = gather(self.ante_offsets, self.ante_items)
+        cons_offsets, cons_items = gather(self.cons_offsets, self.cons_items)
+        return RuleTable(self.ids[indices], self.products, ante_offsets, ante_items, cons_offsets, cons_items,
+                         self.support[indices], self.confidence[indices], self.lift[indices])
+
+
+def bitset_words(n_products):
+    """Words per antecedent bitset, or 0 when the catalog is too large for bitsets."""
+    words = max(1, -(-n_products // 64))
+    return words if words <= MAX_BITSET_WORDS else 0
+
+
+def items_bitset(items, words):
+    """Fixed-width uint64 bitset with the bits of product ids ``items`` set."""
+    items = np.asarray(items, dtype=np.int64)
+    bits = np.zeros(words, dtype=np.uint64)
+    np.bitwise_or.at(bits, items // 64, np.left_shift(np.uint64(1), (items % 64).astype(np.uint64)))
+    return bits
+
+
+def antecedent_bitsets(table, words):
+    """``(n_rules, words)`` uint64 array: row ``i`` is the bitset of rule ``i``'s antecedent."""
+    items = table.ante_items.astype(np.int64)
+    rule_of_item = np.repeat(np.arange(len(table)), table.antecedent_sizes())
+    bits = np.zeros((len(table), words), dtype=np.uint64)
+    np.bitwise_or.at(bits, (rule_of_item, items // 64), np.left_shift(np.uint64(1), (items % 64).astype(np.uint64)))
+    return bits
+
+
+class RuleStore:
+    # derived arrays that can be persisted next to the table (see snapshot.py)
+    INDEX_ARRAYS = ("rank", "posting_rules", "posting_bounds")
+
+    def __init__(self, rules, index=None):
+        self.table = rules if isinstance(rules, RuleTable) else RuleTable.from_rules(rules)
+        table = self.table
+        self._by_id = None
+        self._consequent_postings = None
+        self.sizes = table.antecedent_sizes()
+        self.words = bitset_words(len(table.products))
+        # only match_ids' dense path reads the bitsets, so larger stores do not build them
+        self.ante_bits = None
+        if self.words and len(table) <= DENSE_MATCH_RULES:
+            self.ante_bits = antecedent_bitsets(table, self.words)
+        if index is not None:
+            self.rank = index["rank"]
+            self._posting_rules = index["posting_rules"]
+            self._posting_bounds = index["posting_bounds"]
+            return
+        # global strength order (lift desc, confidence desc, original position) used to sort matches
+        self.rank = np.empty(len(table), dtype=np.int64)
+        self.rank[table.order()] = np.arange(len(table))
+        # postings: rule positions grouped by antecedent product id
+        rule_of_item = np.repeat(np.arange(len(table)), self.sizes)
+        by_item = np.argsort(table.ante_items, kind="stable")
+        bounds = np.searchsorted(table.ante_items[by_item], np.arange(len(table.products) + 1))
+        self._posting_rules = rule_of_item[by_item]
+        self._posting_bounds = bounds
+
+    def index_arrays(self):
+        return {"rank": self.rank, "posting_rules": self._posting_rules, "posting_bounds": self._posting_bounds}
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def by_id(self):
+        # built on first lookup so loading a large snapshot stays cheap
+        if self._by_id is None:
+            self._by_id = {rid: i for i, rid in enumerate(self.table.ids.tolist())}
+        return self._by_id
+
+    def get(self, rule_id):
+        i = self.by_id.get(rule_id)
+        return None if i is None else self.table.rule(i)
+
+    def postings(self, item):
+        if not 0 <= item < len(self._posting_bounds) - 1:
+            return self._posting_rules[:0]
+        return self._posting_rules[self._posting_bounds[item]:self._posting_bounds[item + 1]]
+
+    def rules_with_consequent(self, items):
+        """Rule positions (ascending) whose consequent contains any of the product ids ``items``."""
+        if self._consequent_postings is None:
+            # built on first use: only prompt retrieval asks "which rules lead to this product"
+            table = self.table
+            rule_of_item = np.repeat(np.arange(len(table)), np.diff(table.cons_offsets))
+            by_item = np.argsort(table.cons_items, kind="stable")
+            bounds = np.searchsorted(table.cons_items[by_item], np.arange(len(table.products) + 1))
+            self._consequent_postings = (rule_of_item[by_item], bounds)
+        rules, bounds = self._consequent_postings
+        hits = [rules[bounds[i]:bounds[i + 1]] for i in set(items) if 0 <= i < len(bounds) - 1]
+        return np.unique(np.concatenate(hits)) if hits else rules[:0]
+
+    def rules_with_antecedent_product(self, product):
+        item = self.table.products.get(product, -1)
+        return self.table.to_rules(self.postings(item))
+
+    def basket_bits(self, items):
+        return items_bitset(items, self.words)
+
+    def _candidates(self, items):
+        """Rules sharing at least one product with ``items`` (ascending) and how many they share."""
+        postings = [self.postings(i) for i in set(items)]
+        if len(postings) < 2:
+            rules = postings[0] if postings else self._posting_rules[:0]
+            return rules, np.ones(len(rules), dtype=np.int64)
+        # postings are sorted, so a sort of their concatenation groups each rule's hits together
+        rules = np.sort(np.concatenate(postings))
+        first = np.empty(len(rules), dtype=bool)
+        first[:1] = True
+        np.not_equal(rules[1:], rules[:-1], out=first[1:])
+        starts = np.flatnonzero(first)
+        return rules[starts], np.diff(starts, append=len(rules))
+
+    def match_mask(self, items):
+        """``(full, partial)`` flags over every rule: full = (a & b) == a, partial = a & b != 0 otherwise."""
+        if self.ante_bits is None:
+            full = np.zeros(len(self), dtype=bool)
+            partial = np.zeros(len(self), dtype=bool)
+            rules, partial_hits = self.match_ids(items)
+            full[rules[~partial_hits]] = True
+            partial[rules[partial_hits]] = True
+            return full, partial
+        shared = self.ante_bits & self.basket_bits(list(items))
+        full = (shared == self.ante_bits).all(axis=1)
+        return full, shared.any(axis=1) & ~full
+
+    def match_ids(self, items):
+        """Matched rule positions (for product ids ``items``) in answer order, plus partial-match flags."""
+        items = [int(i) for i in items]
+        if self.ante_bits is not None:
+            full, partial = self.match_mask(items)
+            rules = np.flatnonzero(full | partial)
+            partial = partial[rules]
+        else:
+            # only rules sharing a product are touched; full match <=> every antecedent item was hit
+            rules, hits = self._candidates(items)
+            partial = hits < self.sizes[rules]
+        order = np.lexsort((self.rank[rules], partial))
+        return rules[order], partial[order]
+
+    def full_matches(self, products):
+        rules, partial = self.match_ids(self.table.products.encode(products))
+        return self.table.to_rules(rules[~partial])
+
+    def partial_matches(self, products):
+        rules, partial = self.match_ids(self.table.products.encode(products))
+        return self.table.to_rules(rules[partial])
+
+    def match(self, products, limit=None):
+        """Return ``[(rule, "full"|"partial")]``: full antecedent matches first, then by lift/confidence
+        (only the first ``limit`` when given)."""
+        rules, partial = self.match_ids(self.table.products.encode(products))
+        rules, partial = rules[:limit], partial[:limit]
+        return [(self.table.rule(i), "partial" if p else "full") for i, p in zip(rules.tolist(), partial.tolist())]
+
+
+def rules_fingerprint(*parts):
+    """Short stable hash of rules/stats (or of whatever identifies them) used as a cache key."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,176 @@
+"""
+Reglas y estadísticas precargadas (datos provistos).
+- Fuente por defecto del motor cuando no hay snapshot ni export de órdenes configurado.
+"""
+
+RULES = [
+    {
+        "id": "R01",
+        "antecedent": [
+            "Tortillas de maíz Mixtas (Maíz de Corazón) - Docena",
+            "Kombucha de Cardamomo - 750 ml"
+        ],
+        "consequent": ["Kombucha de Jengibre - 750 ml"],
+        "support": 0.0106,
+        "confidence": 0.6737,
+        "lift": 16.28
+    },
+    {
+        "id": "R02",
+        "antecedent": ["Kombucha de Jengibre - 750 ml"],
+        "consequent": [
+            "Tortillas de maíz Mixtas (Maíz de Corazón) - Docena",
+            "Kombucha de Cardamomo - 750 ml"
+        ],
+        "support": 0.0106,
+        "confidence": 0.2560,
+        "lift": 16.28
+    },
+    {
+        "id": "R03",
+        "antecedent": [
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
+        ],
+        "consequent": [
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena",
+            "Fresa - domo de 450 gr - 450 gr"
+        ],
+        "support": 0.0103,
+        "confidence": 0.5299,
+        "lift": 15.62
+    },
+    {
+        "id": "R04",
+        "antecedent": [
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena",
+            "Fresa - domo de 450 gr - 450 gr"
+        ],
+        "consequent": [
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
+        ],
+        "support": 0.0103,
+        "confidence": 0.3024,
+        "lift": 15.62
+    },
+    {
+        "id": "R05",
+        "antecedent": [
+            "Fresa - domo de 450 gr - 450 gr",
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Blueberry - domo de 170 gr - 170 gr"
+        ],
+        "consequent": [
+            "Frambuesa - domo de 170 gr - 170 gr",
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena"
+        ],
+        "support": 0.0104,
+        "confidence": 0.4375,
+        "lift": 14.93
+    },
+    {
+        "id": "R06",
+        "antecedent": [
+            "Frambuesa - domo de 170 gr - 170 gr",
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena"
+        ],
+        "consequent": [
+            "Fresa - domo de 450 gr - 450 gr",
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Blueberry - domo de 170 gr - 170 gr"
+        ],
+        "support": 0.0104,
+        "confidence": 0.3559,
+        "lift": 14.93
+    },
+    {
+        "id": "R07",
+        "antecedent": [
+            "Fresa - domo de 450 gr - 450 gr",
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Blueberry - domo de 170 gr - 170 gr"
+        ],
+        "consequent": [
+            "Frambuesa - domo de 170 gr - 170 gr",
+            "Churros de amaranto natural con maíz y chía - 210 gr"
+        ],
+        "support": 0.0126,
+        "confidence": 0.5278,
+        "lift": 14.90
+    },
+    {
+        "id": "R08",
+        "antecedent": [
+            "Frambuesa - domo de 170 gr - 170 gr",
+            "Churros de amaranto natural con maíz y chía - 210 gr"
+        ],
+        "consequent": [
+            "Fresa - domo de 450 gr - 450 gr",
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Blueberry - domo de 170 gr - 170 gr"
+        ],
+        "support": 0.0126,
+        "confidence": 0.3551,
+        "lift": 14.90
+    },
+    {
+        "id": "R09",
+        "antecedent": [
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
+        ],
+        "consequent": [
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena",
+            "Fresa - domo de 450 gr - 450 gr"
+        ],
+        "support": 0.0103,
+        "confidence": 0.4429,
+        "lift": 14.70
+    },
+    {
+        "id": "R10",
+        "antecedent": [
+            "Churros de amaranto chipotle con maíz y chía - 210 gr",
+            "Huevo de Gallina - 12 pzas - Docena",
+            "Fresa - domo de 450 gr - 450 gr"
+        ],
+        "consequent": [
+            "Churros de amaranto natural con maíz y chía - 210 gr",
+            "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete"
+        ],
+        "support": 0.0103,
+        "confidence": 0.3407,
+        "lift": 14.70
+    }
+]
+
+# Estadísticas generales que usaremos en prompts/respuestas
+STATS = {
+    "total_orders": 6042,
+    "unique_products": 774,
+    "avg_basket_size": 14.61,
+    "total_items_sold": 88303,
+    "top_products_support": [
+        ("Huevo de Gallina - 12 pzas - Docena", 0.577),
+        ("Nopal sin espina | 5 pzas - 5 piezas", 0.372),
+        ("Jitomate saladette - kg - kg", 0.351),
+        ("Blueberry - domo de 170 gr - 170 gr", 0.300),
+        ("Frambuesa - domo de 170 gr - 170 gr", 0.296)
+    ]
+}
+
+# Alias explícitos por SKU (además de los derivados del nombre, ver product_matcher.py)
+PRODUCT_ALIASES = {
+    "Huevo de Gallina - 12 pzas - Docena": ["eggs", "blanquillos"],
+    "Blueberry - domo de 170 gr - 170 gr": ["arándano", "arándanos", "moras azules", "berries"],
+    "Frambuesa - domo de 170 gr - 170 gr": ["raspberry", "raspberries", "berries"],
+    "Fresa - domo de 450 gr - 450 gr": ["strawberry", "strawberries", "berries"],
+    "Jitomate saladette - kg - kg": ["tomate", "tomates"],
+    "Pollo sin retazo | 1.5 a 1.7 kg aprox. - Paquete": ["chicken"],
+}
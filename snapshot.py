@@ -0,0 +1,218 @@
+"""
+Snapshot binario versionado de reglas, diccionario de productos y estadísticas.
+- Un solo archivo: cabecera JSON + arreglos NumPy alineados a 64 bytes.
+- Se carga con mmap: los procesos de Streamlit del mismo host comparten la page cache
+  y el arranque no re-parsea JSON/CSV ni vuelve a minar.
+
+Uso:
+    python snapshot.py rules.json rules.snap   # salida de miner.py -> snapshot
+"""
+
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from products import ProductDictionary
+from rule_store import RuleStore, RuleTable
+
+MAGIC = b"AURSNAP\0"
+# 2: header "kind" (closed itemset snapshots); early format 2 files may also hold an "ante_bits" array,
+# which readers ignore
+FORMAT_VERSION = 2
+ALIGN = 64
+_PREAMBLE = 8 + 4 + 4 + 8  # magic, format version, reserved, header length
+
+# header "kind": rule tables (the default) or closed frequent itemsets
+KIND_RULES = "rules"
+KIND_CLOSED = "closed_itemsets"
+
+TABLE_ARRAYS = ("ids", "ante_offsets", "ante_items", "cons_offsets", "cons_items", "support", "confidence", "lift")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _pad(n):
+    return -n % ALIGN
+
+
+def _encode_labels(labels):
+    blobs = [label.encode("utf-8") for label in labels]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    return np.frombuffer(b"".join(blobs), dtype=np.uint8), offsets
+
+
+def _decode_labels(blob, offsets):
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [data[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+
+def _write(path, arrays, stats, fields):
+    layout = {}
+    offset = 0
+    digest = hashlib.sha1(json.dumps(stats, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        digest.update(array.data)
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+    header = {
+        "format": FORMAT_VERSION,
+        # content hash: the cache key for everything derived from these rules
+        "rules_version": digest.hexdigest()[:16],
+        **fields,
+        "stats": stats,
+        "arrays": layout,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _PREAMBLE + len(header_bytes)
+    data_start += _pad(data_start)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(np.array([FORMAT_VERSION, 0], dtype="<u4").tobytes())
+        fh.write(np.array([len(header_bytes)], dtype="<u8").tobytes())
+        fh.write(header_bytes)
+        fh.write(b"\0" * (data_start - fh.tell()))
+        for array in arrays.values():
+            fh.write(array.tobytes())
+            fh.write(b"\0" * _pad(array.nbytes))
+    os.replace(tmp, path)
+    return header
+
+
+def write_snapshot(path, table, stats, store=None, extra=None):
+    """Write ``table`` (RuleTable), ``stats`` and the RuleStore index to ``path`` atomically."""
+    store = RuleStore(table) if store is None else store
+    label_blob, label_offsets = _encode_labels(table.products.labels)
+    arrays = {name: getattr(table, name) for name in TABLE_ARRAYS}
+    arrays.update(store.index_arrays())
+    arrays["label_blob"] = label_blob
+    arrays["label_offsets"] = label_offsets
+    if extra:
+        arrays.update(extra)
+    return _write(path, arrays, stats, {"n_rules": len(table), "n_products": len(table.products)})
+
+
+def write_itemset_snapshot(path, itemsets, stats):
+    """Write closed itemsets (itemsets.ClosedItemsets) instead of rules; rules are derived when queried."""
+    label_blob, label_offsets = _encode_labels(itemsets.products.labels)
+    arrays = {f"itemset_{name}": getattr(itemsets, name) for name in itemsets.ARRAYS}
+    arrays["label_blob"] = label_blob
+    arrays["label_offsets"] = label_offsets
+    return _write(path, arrays, stats, {
+        "kind": KIND_CLOSED,
+        "n_rules": itemsets.n_rules,
+        "n_products": len(itemsets.products),
+        "n_itemsets": len(itemsets),
+        "itemsets": {"n_baskets": itemsets.n_baskets, "min_confidence": itemsets.min_confidence,
+                     "min_lift": itemsets.min_lift},
+    })
+
+
+class Snapshot:
+    """Read-only view over a snapshot file; every array is a zero-copy slice of the mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:8] != MAGIC:
+            raise SnapshotError(f"{path} is not a rules snapshot")
+        version = int(np.frombuffer(mm, dtype="<u4", count=1, offset=8)[0])
+        # format 1 files are rule snapshots, readable as they are
+        if not 1 <= version <= FORMAT_VERSION:
+            raise SnapshotError(f"unsupported snapshot format {version} (expected at most {FORMAT_VERSION})")
+        header_len = int(np.frombuffer(mm, dtype="<u8", count=1, offset=16)[0])
+        self.header = json.loads(mm[_PREAMBLE:_PREAMBLE + header_len].decode("utf-8"))
+        data_start = _PREAMBLE + header_len
+        self._data_start = data_start + _pad(data_start)
+
+    def array(self, name):
+        spec = self.header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        array = np.frombuffer(self._mm, dtype=dtype, count=count, offset=self._data_start + spec["offset"])
+        return array.reshape(spec["shape"])
+
+    def has_array(self, name):
+        return name in self.header["arrays"]
+
+    @property
+    def stats(self):
+        stats = dict(self.header["stats"])
+        stats["top_products_support"] = [tuple(x) for x in stats["top_products_support"]]
+        return stats
+
+    @property
+    def rules_version(self):
+        return self.header["rules_version"]
+
+    @property
+    def kind(self):
+        return self.header.get("kind", KIND_RULES)
+
+    def products(self):
+        return ProductDictionary(_decode_labels(self.array("label_blob"), self.array("label_offsets")))
+
+    def rule_table(self, products=None):
+        if self.kind != KIND_RULES:
+            raise SnapshotError(f"snapshot holds {self.kind}, not rules (see closed_itemsets())")
+        products = self.products() if products is None else products
+        return RuleTable(products=products, **{name: self.array(name) for name in TABLE_ARRAYS})
+
+    def rule_store(self, table=None):
+        table = self.rule_table() if table is None else table
+        return RuleStore(table, index={name: self.array(name) for name in RuleStore.INDEX_ARRAYS if self.has_array(name)})
+
+    def closed_itemsets(self, products=None):
+        from itemsets import ClosedItemsets
+
+        if self.kind != KIND_CLOSED:
+            raise SnapshotError(f"snapshot holds {self.kind}, not closed itemsets")
+        products = self.products() if products is None else products
+        arrays = {name: self.array(f"itemset_{name}") for name in ClosedItemsets.ARRAYS}
+        return ClosedItemsets(products, n_rules=self.header["n_rules"], **arrays, **self.header["itemsets"])
+
+
+def load_snapshot(path):
+    """Return ``(RuleStore, STATS, rules_version)`` backed by a memory-mapped snapshot."""
+    snap = Snapshot(path)
+    return snap.rule_store(), snap.stats, snap.rules_version
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert miner.py JSON output into a binary rules snapshot.")
+    parser.add_argument("rules_json")
+    parser.add_argument("out")
+    args = parser.parse_args(argv)
+
+    with open(args.rules_json, encoding="utf-8") as fh:
+        data = json.load(fh)
+    stats = data["stats"]
+    if "closed_itemsets" in data:
+        from itemsets import ClosedItemsets
+
+        itemsets = ClosedItemsets.from_json(data)
+        header = write_itemset_snapshot(args.out, itemsets, stats)
+        print(f"{header['n_itemsets']} closed itemsets ({header['n_rules']} rules), {header['n_products']} products"
+              f" -> {args.out} ({os.path.getsize(args.out):,} bytes)")
+        return
+    products = ProductDictionary.from_rules(data["rules"], stats)
+    table = RuleTable.from_rules(data["rules"], products)
+    header = write_snapshot(args.out, table, stats)
+    print(f"{header['n_rules']} rules, {header['n_products']} products -> {args.out} ({os.path.getsize(args.out):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()